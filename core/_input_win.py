@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Direct SendInput mouse path for Windows: skips pyautogui's per-call PAUSE,
+# failsafe checks and platform abstraction (sub-ms per click).
+import ctypes
+from ctypes import wintypes
+
+user32 = ctypes.WinDLL("user32", use_last_error=True)
+
+INPUT_MOUSE = 0
+MOUSEEVENTF_LEFTDOWN   = 0x0002
+MOUSEEVENTF_LEFTUP     = 0x0004
+MOUSEEVENTF_RIGHTDOWN  = 0x0008
+MOUSEEVENTF_RIGHTUP    = 0x0010
+MOUSEEVENTF_MIDDLEDOWN = 0x0020
+MOUSEEVENTF_MIDDLEUP   = 0x0040
+
+_BUTTONS = {
+    "left":   (MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP),
+    "right":  (MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP),
+    "middle": (MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP),
+}
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = (("dx", wintypes.LONG),
+                ("dy", wintypes.LONG),
+                ("mouseData", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t))
+
+# MOUSEINPUT is the largest member of the INPUT union, so sizeof(INPUT) matches
+# what SendInput expects without declaring KEYBDINPUT/HARDWAREINPUT.
+class _INPUTUNION(ctypes.Union):
+    _fields_ = (("mi", MOUSEINPUT),)
+
+class INPUT(ctypes.Structure):
+    _fields_ = (("type", wintypes.DWORD), ("u", _INPUTUNION))
+
+user32.SendInput.argtypes = (wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int)
+user32.SendInput.restype = wintypes.UINT
+user32.SetCursorPos.argtypes = (ctypes.c_int, ctypes.c_int)
+user32.SetCursorPos.restype = wintypes.BOOL
+
+def _mouse(flags: int) -> INPUT:
+    return INPUT(type=INPUT_MOUSE, u=_INPUTUNION(mi=MOUSEINPUT(0, 0, 0, flags, 0, 0)))
+
+def move(x: int, y: int):
+    # SetCursorPos takes virtual-screen pixels directly (no 0..65535 scaling)
+    if not user32.SetCursorPos(int(x), int(y)):
+        raise ctypes.WinError(ctypes.get_last_error())
+
+def click(x: int, y: int, button: str = "left"):
+    down, up = _BUTTONS.get((button or "left").lower(), _BUTTONS["left"])
+    move(x, y)
+    events = (INPUT * 2)(_mouse(down), _mouse(up))
+    if user32.SendInput(2, events, ctypes.sizeof(INPUT)) != 2:
+        raise ctypes.WinError(ctypes.get_last_error())
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# X11 XTest mouse path (python-xlib): the non-Windows counterpart of _input_win.
+from Xlib import X, display
+from Xlib.ext import xtest
+
+_BUTTONS = {"left": 1, "middle": 2, "right": 3}
+_display = None
+
+def _disp():
+    global _display
+    if _display is None:
+        _display = display.Display()
+    return _display
+
+def move(x: int, y: int):
+    d = _disp()
+    xtest.fake_input(d, X.MotionNotify, x=int(x), y=int(y))
+    d.sync()
+
+def click(x: int, y: int, button: str = "left"):
+    d = _disp()
+    btn = _BUTTONS.get((button or "left").lower(), 1)
+    xtest.fake_input(d, X.MotionNotify, x=int(x), y=int(y))
+    xtest.fake_input(d, X.ButtonPress, btn)
+    xtest.fake_input(d, X.ButtonRelease, btn)
+    d.sync()
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import sys, os, re, time, math, random, logging, subprocess, importlib, threading, platform
+import sys, os, re, json, time, math, random, hashlib, logging, subprocess, importlib, threading, platform, weakref
+from collections import ChainMap
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from urllib.parse import quote_plus
 
 # -------- Logger --------
@@ -25,14 +27,42 @@ class RestartRequested(Exception):
 SKIP_EVENT = None
 PAUSE_TOGGLE_EVENT = None
 EXIT_EVENT = None
+HOTKEY_WAKE_EVENT = None
+_ACTIVE_PROGRAM = None  # weakref to the XMLProgram currently running
+
+def _hotkey_forwarder():
+    # Single bridge thread: block until the WinAPI loop reports a hotkey,
+    # then forward it onto the running program's events.
+    while True:
+        HOTKEY_WAKE_EVENT.wait()
+        HOTKEY_WAKE_EVENT.clear()
+        prog = _ACTIVE_PROGRAM() if _ACTIVE_PROGRAM is not None else None
+        if prog is None:
+            continue  # keep events set; run() wakes us once a program is published
+        try:
+            if SKIP_EVENT.is_set():
+                SKIP_EVENT.clear()
+                prog.skip_wait = True
+            if PAUSE_TOGGLE_EVENT.is_set():
+                PAUSE_TOGGLE_EVENT.clear()
+                prog._toggle_pause()
+            if EXIT_EVENT.is_set():
+                EXIT_EVENT.clear()
+                prog.exit_flag = True
+                prog.logger.info("Exit requested via hotkey (bridge)")
+        except Exception:
+            pass
+
 try:
     if platform.system().lower() == "windows":
         sys.path.insert(0, os.path.dirname(__file__))
-        from hotkeys_win_safe import start_hotkeys, SKIP_EVENT as _SE, PAUSE_TOGGLE_EVENT as _PE, EXIT_EVENT as _EE
+        from hotkeys_win_safe import start_hotkeys, SKIP_EVENT as _SE, PAUSE_TOGGLE_EVENT as _PE, EXIT_EVENT as _EE, WAKE_EVENT as _WE
         start_hotkeys()
         SKIP_EVENT = _SE
         PAUSE_TOGGLE_EVENT = _PE
         EXIT_EVENT = _EE
+        HOTKEY_WAKE_EVENT = _WE
+        threading.Thread(target=_hotkey_forwarder, daemon=True).start()
         print("[xml_engine_full_voice] hotkeys_win_safe started", file=sys.stderr)
 except Exception as e:
     print(f"[xml_engine_full_voice] hotkeys bridge unavailable: {e}", file=sys.stderr)
@@ -45,18 +75,29 @@ except Exception:
 
 try:
     import pyautogui, pyperclip
+    pyautogui.PAUSE = 0  # the engine paces itself with <wait>; skip the implicit 100 ms
 except Exception:
     pyautogui = None; pyperclip = None
 
+# Fast native click path (opt-in): SendInput on Windows, XTest on X11
+_FAST_INPUT = None
+if os.getenv("USEFULCLICKER_FAST_INPUT", "0").strip().lower() in ("1","true","yes"):
+    try:
+        _FAST_INPUT = importlib.import_module("core._input_win" if os.name == "nt" else "core._input_x11")
+    except Exception as e:
+        print(f"[xml_engine] fast input unavailable, using pyautogui: {e}", file=sys.stderr)
+
 try:
     import pygetwindow as gw
 except Exception:
     gw = None
 
-try:
-    from lxml import etree as ET
-except Exception:
-    import xml.etree.ElementTree as ET  # type: ignore
+from lxml import etree as ET
+
+# remove_blank_text drops whitespace-only text between elements (roughly halves
+# the tree for typical programs); the prolog is handled natively by lxml.
+_XML_PARSER = ET.XMLParser(huge_tree=True, remove_blank_text=True)
+_XP_FUNC = ET.XPath("//func")
 
 # Voice (optional)
 # перед import VoiceDaemon:
@@ -77,6 +118,7 @@ except Exception:
 
 # -------- Substitution & eval --------
 _VAR_PATTERN = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)(?:\|([A-Za-z_][A-Za-z0-9_]*))?\}")
+_SPLIT_LINES = re.compile(r"[\r\n]+")
 
 def _apply_filter(value: str, filt: Optional[str]) -> str:
     f = (filt or "").strip().lower()
@@ -84,13 +126,83 @@ def _apply_filter(value: str, filt: Optional[str]) -> str:
         return quote_plus(str(value))
     return str(value)
 
+@lru_cache(maxsize=4096)
+def _compile_template(s: str):
+    """Scan a raw attribute once and return a fill(variables) -> str closure."""
+    if "${" not in s:
+        return lambda variables: s
+    pieces = []  # (literal, var, filt) tuples
+    pos = 0
+    for m in _VAR_PATTERN.finditer(s):
+        pieces.append((s[pos:m.start()], m.group(1), m.group(2)))
+        pos = m.end()
+    tail = s[pos:]
+    if not pieces:
+        return lambda variables: s
+    def fill(variables):
+        out = []
+        for lit, var, filt in pieces:
+            out.append(lit)
+            raw = variables.get(var, "")
+            out.append(_apply_filter(raw, filt) if filt is not None else str(raw))
+        out.append(tail)
+        return "".join(out)
+    return fill
+
 def _substitute_vars(value: Optional[str], variables: Dict[str, Any]) -> str:
     if value is None: return ""
-    def repl(m):
-        var, filt = m.group(1), m.group(2)
-        raw = variables.get(var, "")
-        return _apply_filter(raw, filt)
-    return _VAR_PATTERN.sub(repl, value)
+    if "${" not in value: return value
+    return _compile_template(value)(variables)
+
+_FAST_TYPES = (int, float, bool)
+
+class _VarScope(ChainMap):
+    """Variable store: loop frames (maps[:-2]) shadow the globals.
+
+    The globals are split into a numeric slot store (maps[-2], hit first by
+    lookups) and everything else (maps[-1]). Assigning to a name updates the
+    innermost frame that already holds it; otherwise it goes to the global map
+    matching the value's type, so <set> inside a loop body outlives the loop.
+    ``epoch`` counts writes so pollers (the Qt UI) can skip unchanged state;
+    ``on_change`` (if set) is called after each write, from the engine thread.
+    """
+    epoch = 0
+    on_change = None
+
+    def __init__(self, *maps):
+        super().__init__(*(maps or ({}, {})))
+
+    def touch(self):
+        self.epoch += 1
+        cb = self.on_change
+        if cb is not None: cb()
+
+    def __setitem__(self, key, value):
+        self.touch()
+        for m in self.maps[:-2]:
+            if key in m:
+                m[key] = value; return
+        fast, slow = self.maps[-2], self.maps[-1]
+        if type(value) in _FAST_TYPES:
+            fast[key] = value; slow.pop(key, None)
+        else:
+            slow[key] = value; fast.pop(key, None)
+
+    def __delitem__(self, key):
+        self.touch()
+        for m in self.maps:
+            if key in m:
+                del m[key]; return
+        raise KeyError(key)
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default: return default[0]
+            raise
+        del self[key]
+        return value
 
 _ALLOWED = {
     "pi": math.pi, "e": math.e, "tau": math.tau,
@@ -99,9 +211,16 @@ _ALLOWED = {
     "randint": lambda a,b: random.randint(int(a), int(b)),
 }
 
+# Helpers live in the globals dict so variables can be passed to eval as the
+# locals mapping as-is: names resolve variables first, then helpers.
+_EVAL_GLOBALS = {"__builtins__": {}, **_ALLOWED}
+
+@lru_cache(maxsize=2048)
+def _compile_expr(expr: str):
+    return compile(expr.replace("&lt;","<").replace("&gt;",">"), "<xml-expr>", "eval")
+
 def _safe_eval(expr: str, env: Dict[str, Any]) -> Any:
-    expr = (expr or "").replace("&lt;","<").replace("&gt;",">")
-    return eval(expr, {"__builtins__": {}}, {**_ALLOWED, **env})
+    return eval(_compile_expr(expr or ""), _EVAL_GLOBALS, env)
 
 def _smart_cast(s: Any):
     if isinstance(s, (int,float,bool)): return s
@@ -114,6 +233,72 @@ def _smart_cast(s: Any):
     except Exception:
         return s
 
+# -------- LLM clients --------
+# Client classes are resolved once at import; instances are built lazily and
+# shared per provider so HTTP sessions are reused across <llmcall>/<extnode>.
+_LLM_CLASSES: Dict[str, Any] = {}
+_LLM_IMPORT_ERRORS: Dict[str, Exception] = {}
+for _key, _mod, _cls in (("compat", "llm.openai_client_compat", "LLMClientCompat"),
+                         ("native", "llm.openai_client", "LLMClient"),
+                         ("ollama", "llm.ollama_client", "OllamaClient")):
+    try:
+        _LLM_CLASSES[_key] = getattr(importlib.import_module(_mod), _cls)
+    except Exception as _e:
+        _LLM_IMPORT_ERRORS[_key] = _e
+
+_LLM_CLIENTS: Dict[str, Any] = {}
+_LLM_LOCK = threading.Lock()
+
+def _build_llm(kind: str):
+    cls = _LLM_CLASSES.get(kind)
+    if cls is None:
+        raise _LLM_IMPORT_ERRORS.get(kind) or ImportError(kind)
+    return cls()
+
+def _get_llm(provider: Optional[str], log: logging.Logger):
+    """Return the shared LLM client for provider ('openai', 'ollama' or auto)."""
+    prov = (provider or "").strip().lower()
+    client = _LLM_CLIENTS.get(prov)
+    if client is not None:
+        return client
+    with _LLM_LOCK:
+        client = _LLM_CLIENTS.get(prov)
+        if client is not None:
+            return client
+        log.info(f"LLM: creating client for provider={provider or '<auto>'}...")
+        if prov == "ollama":
+            order = ("ollama",)
+        elif prov == "openai":
+            order = ("compat", "native")
+        elif not prov:
+            # auto-detect: try OpenAI compat, then native, then Ollama
+            order = ("compat", "native", "ollama")
+        else:
+            log.info(f"LLM: unknown provider '{provider}', skipping client setup")
+            return None
+        errors = []
+        for kind in order:
+            try:
+                client = _build_llm(kind)
+            except Exception as e:
+                errors.append(e); continue
+            log.info(f"LLM: client ready ({kind}).")
+            _LLM_CLIENTS[prov] = client
+            return client
+        log.info(f"LLM: client unavailable ({' / '.join(str(e) for e in errors)})")
+        return None
+
+# <extnode> attributes consumed by the engine rather than passed as kwargs
+_EXT_RESERVED = frozenset({"module","class","method","func","output_var","output_format","separator"})
+
+# -------- Merged-XML cache --------
+def _cache_dir() -> Path:
+    return Path(os.getenv("USEFULCLICKER_CACHE_DIR") or (Path.home() / ".cache" / "usefulclicker"))
+
+def _mtime_ns(p: Path) -> Optional[int]:
+    try: return p.stat().st_mtime_ns
+    except OSError: return None
+
 # -------- Low-level actions --------
 def _hotkey(combo: str):
     sent=False
@@ -129,18 +314,38 @@ def _type_text(text: str, mode: str = "type"):
     s = str(text)
     if mode.lower() != "copy_paste" or not pyperclip:
         pyautogui.write(s); return
-    ok=False
-    for attempt in range(5):
-        try: pyperclip.copy(s)
-        except Exception: time.sleep(0.05); continue
-        time.sleep(0.1 + 0.05*attempt)
-        try: cur = pyperclip.paste()
-        except Exception: cur=None
-        if cur == s: ok=True; break
+    try: pyperclip.copy(s)
+    except Exception:
+        pyautogui.write(s); return
+    # copy() is synchronous; short strings are pasted without a read-back
+    ok = len(s) < 32
+    t0 = time.perf_counter()
+    while not ok and time.perf_counter()-t0 < 0.25:
+        try: ok = pyperclip.paste() == s
+        except Exception: pass
+        if not ok: time.sleep(0.005)
     if ok: pyautogui.hotkey("ctrl","v")
     else:  pyautogui.write(s)
 
+_SCREEN_SIZE: Optional[tuple] = None
+
+def _screen_size() -> Optional[tuple]:
+    """(width, height) from pyautogui.size(), cached for the process."""
+    global _SCREEN_SIZE
+    if _SCREEN_SIZE is None and pyautogui:
+        try:
+            sw, sh = pyautogui.size()
+            _SCREEN_SIZE = (int(sw), int(sh))
+        except Exception:
+            pass
+    return _SCREEN_SIZE
+
 def _click_xy(x: int, y: int, button: str="left"):
+    if _FAST_INPUT is not None:
+        try:
+            _FAST_INPUT.click(int(x), int(y), button); return
+        except Exception as e:
+            logger.info(f"fast click error, falling back to pyautogui: {e}")
     if pyautogui:
         try:
             pyautogui.moveTo(int(x), int(y), duration=0.02)
@@ -151,14 +356,23 @@ def _click_xy(x: int, y: int, button: str="left"):
 # -------- Engine --------
 class XMLProgram:
     def __init__(self, xml_path: Path, debug: bool=False, log_path: Optional[Path]=None):
+        # bumped on every control-state change; see state_epoch
+        self._ctl_epoch = 0
+        self.on_state_change: Optional[Callable[[], None]] = None
+        # control events: waits block on _wake_evt instead of polling flags
+        self._wake_evt = threading.Event()
+        self._skip_evt = threading.Event()
+        self._pause_evt = threading.Event()  # set while paused
+        self._exit_flag = False
+        self._restart_requested = False
         self.xml_path = Path(xml_path)
         self.logger = logger
-        self.variables: Dict[str, Any] = {}
+        self.variables: _VarScope = _VarScope()
         self.functions: Dict[str, ET.Element] = {}
+        self._func_bodies: Dict[str, tuple] = {}
         # Start the engine in paused mode so UI/runner can inspect before resuming
         self.paused = False
         self.skip_wait = False
-        self._last_ctrlspace = False
         self._hotkeys_started = False
         self._extmodule_cache = {}
         self._extclass_cache = {}
@@ -169,6 +383,72 @@ class XMLProgram:
         self.exit_flag = False
         # timestamp until which hotkey handling (external) should be suppressed
         self._suppress_hotkeys_until = 0.0
+        # per-element side tables built once by _load_xml (keyed by id(element))
+        self._children: Dict[int, tuple] = {}
+        self._tagl: Dict[int, str] = {}
+        self._ext_plans: Dict[int, tuple] = {}
+        self._if_plans: Dict[int, tuple] = {}
+        self._body_plans: Dict[int, tuple] = {}
+
+    # ---- control state ----
+    @property
+    def state_epoch(self) -> int:
+        """Grows whenever control flags or variables change; equal values mean nothing to redraw."""
+        return self._ctl_epoch + self.variables.epoch
+
+    def set_state_listener(self, cb: Optional[Callable[[], None]]):
+        """Call cb (from whichever thread made the change) on every control flag or
+        variable change. UIs use it to wake up instead of polling."""
+        self.on_state_change = cb
+        self.variables.on_change = cb
+
+    def _bump(self):
+        self._ctl_epoch += 1
+        cb = self.on_state_change
+        if cb is not None: cb()
+
+    @property
+    def paused(self) -> bool:
+        return self._pause_evt.is_set()
+
+    @paused.setter
+    def paused(self, value: bool):
+        if value: self._pause_evt.set()
+        else: self._pause_evt.clear()
+        self._bump()
+        self._wake_evt.set()
+
+    @property
+    def skip_wait(self) -> bool:
+        return self._skip_evt.is_set()
+
+    @skip_wait.setter
+    def skip_wait(self, value: bool):
+        if value:
+            self._skip_evt.set(); self._wake_evt.set()
+        else:
+            self._skip_evt.clear()
+        self._bump()
+
+    @property
+    def exit_flag(self) -> bool:
+        return self._exit_flag
+
+    @exit_flag.setter
+    def exit_flag(self, value: bool):
+        self._exit_flag = bool(value)
+        self._bump()
+        if value: self._wake_evt.set()
+
+    @property
+    def restart_requested(self) -> bool:
+        return self._restart_requested
+
+    @restart_requested.setter
+    def restart_requested(self, value: bool):
+        self._restart_requested = bool(value)
+        self._bump()
+        if value: self._wake_evt.set()
 
     def _suppress_hotkeys_for(self, seconds: float):
         try:
@@ -176,14 +456,10 @@ class XMLProgram:
         except Exception:
             self._suppress_hotkeys_until = time.monotonic() + 0.5
 
-        # Screen defaults
-        try:
-            if pyautogui:
-                sw, sh = pyautogui.size()
-                self.variables["SCREEN_W"] = int(sw)
-                self.variables["SCREEN_H"] = int(sh)
-        except Exception:
-            pass
+        # Screen defaults (queried once per process)
+        size = _screen_size()
+        if size:
+            self.variables["SCREEN_W"], self.variables["SCREEN_H"] = size
         self.variables.setdefault("SCREEN_W", 1920)
         self.variables.setdefault("SCREEN_H", 1080)
 
@@ -198,6 +474,12 @@ class XMLProgram:
     # ---- hotkeys fallback ----
     def _start_fallback_hotkeys(self):
         if self._hotkeys_started: return
+        if keyboard is None:
+            # no 'keyboard' package: poll Win32 key state directly, unless the
+            # RegisterHotKey bridge already delivers the same hotkeys
+            if HOTKEY_WAKE_EVENT is None and os.name == "nt":
+                self._start_pause_listener()
+            return
         def worker():
             # Fallback hotkey registration using 'keyboard' library
             if keyboard is None:
@@ -223,6 +505,36 @@ class XMLProgram:
                 self.logger.info(f"keyboard hotkeys error: {e}")
         threading.Thread(target=worker, daemon=True).start()
 
+    def _start_pause_listener(self):
+        """Edge-triggered GetAsyncKeyState poller (~1 kHz) for Ctrl+Space/Ctrl+N/Esc/Ctrl+Q."""
+        try:
+            import ctypes
+            get_state = ctypes.windll.user32.GetAsyncKeyState
+        except Exception as e:
+            self.logger.info(f"GetAsyncKeyState unavailable: {e}"); return
+        VK_CONTROL, VK_SPACE, VK_N, VK_ESCAPE, VK_Q = 0x11, 0x20, 0x4E, 0x1B, 0x51
+        ref = weakref.ref(self)  # let the thread end once the program is gone
+        def down(vk): return bool(get_state(vk) & 0x8000)
+        def worker():
+            prev_pause = prev_skip = False
+            while True:
+                prog = ref()
+                if prog is None: return
+                ctrl = down(VK_CONTROL)
+                pause = ctrl and down(VK_SPACE)
+                skip = ctrl and down(VK_N)
+                if pause and not prev_pause: prog._toggle_pause()
+                if skip and not prev_skip: prog._skip_now()
+                if not prog.exit_flag and (down(VK_ESCAPE) or (ctrl and down(VK_Q))):
+                    prog.exit_flag = True
+                    prog.logger.info("Exit requested via hotkey (key state)")
+                prev_pause, prev_skip = pause, skip
+                del prog
+                time.sleep(0.001)
+        threading.Thread(target=worker, daemon=True).start()
+        self._hotkeys_started = True
+        self.logger.info("Hotkeys armed (GetAsyncKeyState): pause=Ctrl+Space, skip=Ctrl+N, exit=Esc/Ctrl+Q")
+
     def request_restart(self):
         """Request a restart of the running program. The engine will raise
         RestartRequested at the next safe checkpoint (before next node or inside waits).
@@ -245,70 +557,40 @@ class XMLProgram:
         self.skip_wait = True
         self.logger.info("WAIT skip requested")
 
-    def _poll_hotkeys_inline(self):
-        global SKIP_EVENT, PAUSE_TOGGLE_EVENT, EXIT_EVENT
-        try:
-            if SKIP_EVENT is not None and SKIP_EVENT.is_set():
-                SKIP_EVENT.clear()
-                self.skip_wait = True
-            if PAUSE_TOGGLE_EVENT is not None and PAUSE_TOGGLE_EVENT.is_set():
-                PAUSE_TOGGLE_EVENT.clear()
-                self._toggle_pause()
-            if EXIT_EVENT is not None and EXIT_EVENT.is_set():
-                EXIT_EVENT.clear()
-                self.exit_flag = True
-                self.logger.info("Exit requested via hotkey (inline)")
-        except Exception:
-            pass
-        if keyboard is None: return
-        try:
-            # If fallback hotkeys (keyboard.add_hotkey) have been started in a
-            # separate thread, avoid inline polling toggles to prevent double
-            # toggles caused by both mechanisms. Use inline polling only if no
-            # fallback hotkeys are active.
-            if not self._hotkeys_started:
-                if keyboard.is_pressed("ctrl") and keyboard.is_pressed("n"):
-                    self.skip_wait = True
-                pressed = keyboard.is_pressed("ctrl") and keyboard.is_pressed("space")
-                if pressed and not self._last_ctrlspace:
-                    self._toggle_pause(); self._last_ctrlspace=True
-                if not pressed and self._last_ctrlspace:
-                    self._last_ctrlspace=False
-        except Exception:
-            pass
-
     def _pause_gate(self):
         while self.paused:
+            # clear before re-checking so a concurrent set() is never lost
+            self._wake_evt.clear()
             # check for exit request
             if self.exit_flag:
                 raise SystemExit
             if self.restart_requested:
                 raise RestartRequested()
-            self._poll_hotkeys_inline()
-            time.sleep(0.05)
+            if not self.paused:
+                return
+            self._wake_evt.wait()
 
     def _sleep_ms_interruptible(self, ms:int):
         if ms<=0: return
         end = time.monotonic() + ms/1000.0
-        tick = 0.03
         while True:
+            self._wake_evt.clear()
             # check for exit request
             if self.exit_flag:
                 raise SystemExit
             if self.restart_requested:
                 raise RestartRequested()
-            self._poll_hotkeys_inline()
             if self.skip_wait:
                 self.skip_wait = False
                 self.logger.info("WAIT interrupted")
                 return
             if self.paused:
-                time.sleep(tick)
+                self._wake_evt.wait()
                 continue
             now = time.monotonic()
             if now >= end:
                 return
-            time.sleep(min(tick, end-now))
+            self._wake_evt.wait(end-now)
 
     # ---- Voice ----
     def _ensure_voice(self):
@@ -399,14 +681,140 @@ class XMLProgram:
         self.logger.info(f"VOICE_POLL -> {out_cmd}='{cmd}' {out_query}='{query}'")
 
     # ---- XML ----
+    def _expand_includes(self, root, base_dir: Path, seen: Optional[set] = None, deps: Optional[list] = None):
+        """Splice <include>path</include> elements in place (DOM-level merge).
+
+        An included <program> contributes its children; any other root element
+        is inserted as-is. Paths resolve against the including file's folder.
+        Every include path looked at is appended to deps as (path, mtime_ns|None).
+        """
+        seen = set() if seen is None else seen
+        incs = [el for el in root.iter() if isinstance(el.tag, str) and el.tag.lower() == "include"]
+        for inc in incs:
+            rel = (inc.text or "").strip()
+            inc_path = (base_dir / rel).resolve()
+            parent = inc.getparent()
+            if parent is None:
+                continue
+            if deps is not None:
+                deps.append((str(inc_path), _mtime_ns(inc_path)))
+            if not rel or not inc_path.exists():
+                self.logger.info(f"Include not found: {inc_path}")
+            elif inc_path in seen:
+                self.logger.info(f"Include cycle skipped: {inc_path}")
+            else:
+                try:
+                    child_root = ET.parse(str(inc_path), _XML_PARSER).getroot()
+                    self._expand_includes(child_root, inc_path.parent, seen | {inc_path}, deps)
+                    if isinstance(child_root.tag, str) and child_root.tag.lower() == "program":
+                        for c in list(child_root):
+                            inc.addprevious(c)
+                    else:
+                        inc.addprevious(child_root)
+                except Exception as e:
+                    self.logger.info(f"Include error for {inc_path}: {e}")
+            parent.remove(inc)
+
+    def _load_merged(self, raw: bytes):
+        """Parse the program with includes merged, via the on-disk merge cache."""
+        main = self.xml_path.resolve()
+        # one entry per program, overwritten on change; the source hash validates it
+        entry = _cache_dir() / f"{hashlib.sha1(str(main).encode('utf-8')).hexdigest()}.json"
+        digest = hashlib.sha1(raw).hexdigest()
+        try:
+            cached = json.loads(entry.read_text(encoding="utf-8"))
+            if cached.get("sha") == digest and all(_mtime_ns(Path(p)) == m for p, m in cached["includes"]):
+                return ET.fromstring(cached["xml"].encode("utf-8"), _XML_PARSER)
+        except Exception:
+            pass
+        root = ET.fromstring(raw, _XML_PARSER)
+        deps: list = []
+        self._expand_includes(root, main.parent, {main}, deps)
+        if deps:  # programs without includes are cheaper to parse directly
+            try:
+                entry.parent.mkdir(parents=True, exist_ok=True)
+                entry.write_text(json.dumps({"sha": digest, "includes": deps, "xml": ET.tostring(root, encoding="unicode")}), encoding="utf-8")
+            except Exception as e:
+                self.logger.info(f"XML cache write skipped: {e}")
+        return root
+
     def _load_xml(self):
-        txt = self.xml_path.read_text(encoding="utf-8")
-        self.tree = ET.fromstring(txt.encode("utf-8"))
-        for f in self.tree.findall(".//func"):
+        self.tree = self._load_merged(self.xml_path.read_bytes())
+        # One pass over the tree: materialize children tuples and lowered tags,
+        # and pre-warm substitution templates for every static attribute/text.
+        # The children tuples also keep lxml proxies alive, so id() stays stable.
+        # Lowered tags stay in _tagl: lxml builds a new str on every .tag read.
+        self._children.clear(); self._tagl.clear(); self._ext_plans.clear(); self._if_plans.clear()
+        self._body_plans.clear()
+        ifs = []
+        for el in self.tree.iter():
+            self._children[id(el)] = tuple(el)
+            tag = el.tag
+            tagl = self._tagl[id(el)] = sys.intern(tag.lower()) if isinstance(tag, str) else ""
+            if tagl and tag != tagl:
+                el.tag = tagl  # normalize once so XPath and node.tag readers agree
+            if tagl == "extnode":
+                self._ext_plans[id(el)] = self._build_ext_plan(el)
+            elif tagl == "if":
+                ifs.append(el)
+            for v in el.attrib.values():
+                _compile_template(v)
+            if el.text: _compile_template(el.text)
+        # plans read their children's tags, so build them after the walk
+        for el in ifs:
+            self._if_plans[id(el)] = self._build_if_plan(el)
+        for f in _XP_FUNC(self.tree):
             name = f.get("name")
-            if name: self.functions[name]=f
+            if name:
+                self.functions[name]=f
+                self._func_bodies[name]=self._body_of(f)
         self.logger.info("XML loaded OK")
 
+    # ---- specialized dispatch ----
+    # A body plan is a tuple of (handler, tagl, node) resolved once per element
+    # (handler is the unbound function from _DISPATCH);
+    # _run_body walks it directly instead of re-dispatching through _exec_node.
+    def _plan_nodes(self, nodes) -> tuple:
+        plan = []
+        for n in nodes:
+            tagl = self._tag_of(n)
+            if tagl:
+                plan.append((self._DISPATCH.get(tagl, XMLProgram._exec_children), tagl, n))
+        return tuple(plan)
+
+    def _body_of(self, node) -> tuple:
+        body = self._body_plans.get(id(node))
+        if body is None:
+            body = self._body_plans[id(node)] = self._plan_nodes(self._kids(node))
+        return body
+
+    def _run_body(self, body: tuple):
+        g = self.variables.maps[-1]
+        for handler, tagl, node in body:
+            if self._exit_flag:
+                raise SystemExit
+            if self._restart_requested:
+                raise RestartRequested()
+            # expose current node info for UIs (always a global slot)
+            g["_CURRENT_NODE_TAG"] = tagl
+            if self._pause_evt.is_set():
+                self._pause_gate()
+            handler(self, node)
+
+    def _exec_children(self, node):
+        self._run_body(self._body_of(node))
+
+    def _kids(self, node) -> tuple:
+        ch = self._children.get(id(node))
+        return ch if ch is not None else tuple(node)
+
+    def _tag_of(self, node) -> str:
+        t = self._tagl.get(id(node))
+        if t is None:
+            tag = getattr(node, "tag", None)
+            t = tag.lower() if isinstance(tag, str) else ""
+        return t
+
     # ---- handlers ----
     def handle_set(self, node: ET.Element):
         for k,v in node.attrib.items():
@@ -499,31 +907,34 @@ class XMLProgram:
                 time.sleep(interval_ms/1000.0)
         self.logger.info(f"FOCUS title~='{title}' -> {ok}")
 
+    def _build_if_plan(self, node) -> tuple:
+        """(cond template, then-plan, else-plan) split at the first <else/>."""
+        children = self._kids(node)
+        tags = [self._tag_of(c) for c in children]
+        cut = tags.index("else") if "else" in tags else len(children)
+        then_ch = self._plan_nodes(children[:cut])
+        else_ch = self._plan_nodes(c for c, t in zip(children[cut:], tags[cut:]) if t != "else")
+        return _compile_template(node.get("cond","")), then_ch, else_ch
+
     def handle_if(self, node: ET.Element):
-        cond_raw = node.get("cond","")
-        cond = _substitute_vars(cond_raw, self.variables)
-        try: res = bool(eval(cond or "False", {"__builtins__": {}}, {}))
+        plan = self._if_plans.get(id(node))
+        if plan is None:
+            plan = self._if_plans[id(node)] = self._build_if_plan(node)
+        fill, then_ch, else_ch = plan
+        cond = fill(self.variables).strip()
+        try: res = bool(_safe_eval(cond or "False", self.variables))
         except Exception as e:
             self.logger.info(f"IF eval error: {e}"); res=False
-        children=list(node)
-        if res:
-            for sub in children:
-                if isinstance(getattr(sub, "tag", None), str) and sub.tag.lower()=="else": break
-                self._exec_node(sub)
-        else:
-            hit=False
-            for sub in children:
-                if isinstance(getattr(sub, "tag", None), str) and sub.tag.lower()=="else":
-                    hit=True; continue
-                if hit: self._exec_node(sub)
+        self._run_body(then_ch if res else else_ch)
 
     def handle_repeat(self, node: ET.Element):
         expr = node.get("times","0")
         try: times = int(float(_safe_eval(_substitute_vars(expr, self.variables), self.variables)))
         except Exception: times = 0
         self.logger.info(f"REPEAT times={times}")
+        body = self._body_of(node)
         for _ in range(times):
-            for ch in list(node): self._exec_node(ch)
+            self._run_body(body)
 
     def handle_list(self, node: ET.Element):
         """Handle <list> node: create a list or text variable from inline text.
@@ -552,7 +963,7 @@ class XMLProgram:
             raw = raw_attr or (node.text or "")
         raw = _substitute_vars(raw, self.variables)
         if out_fmt == "list":
-            items = [s for s in re.split(r"[\r\n]+", raw) if s.strip()]
+            items = [s for s in _SPLIT_LINES.split(raw) if s.strip()]
             # if separator explicitly provided, split by it instead
             if separator and separator != "\n":
                 items = [s for s in raw.split(separator) if s.strip()]
@@ -572,7 +983,7 @@ class XMLProgram:
         for k,v in node.attrib.items():
             if k.startswith("arg"): self.variables[k]=_substitute_vars(v, self.variables)
         self.logger.info(f"CALL {name}")
-        for ch in list(f): self._exec_node(ch)
+        self._run_body(self._func_bodies[name])
 
     def handle_foreach(self, node: ET.Element):
         list_name = node.get("list","")
@@ -581,20 +992,26 @@ class XMLProgram:
             self.logger.info(f"FOREACH unknown func: {func_name}"); return
         data = self.variables.get(list_name, [])
         if isinstance(data, str):
-            items = [s for s in re.split(r"[\r\n]+", data) if s.strip()]
+            items = [s for s in _SPLIT_LINES.split(data) if s.strip()]
         else:
             items = list(data)
         if str(node.get("random_shuffle","0")).lower() in ("1","true","yes"):
             random.shuffle(items)
-        for idx, item in enumerate(items):
-            self.variables["item"] = item
-            self.variables["index"] = idx
-            self.variables["arg0"] = item
-            f = self.functions[func_name]
-            for ch in list(f): self._exec_node(ch)
-        self.variables.pop("item", None)
-        self.variables.pop("index", None)
-        self.variables.pop("arg0", None)
+        body = self._func_bodies[func_name]
+        # loop-local slots live in their own frame; globals are not churned
+        frame: Dict[str, Any] = {}
+        v = self.variables
+        v.maps.insert(0, frame)
+        try:
+            for idx, item in enumerate(items):
+                frame["item"] = item
+                frame["index"] = idx
+                frame["arg0"] = item
+                v.touch()  # frame writes bypass _VarScope.__setitem__
+                self._run_body(body)
+        finally:
+            v.maps.pop(0)
+            v.touch()
 
     def handle_llmcall(self, node: ET.Element):
         # параметры
@@ -622,49 +1039,7 @@ class XMLProgram:
 
         # select LLM client based on provider: 'openai', 'ollama', or auto
         provider = node.get("provider")
-        llm_client = None
-        self.logger.info(f"LLM: creating client for provider={provider or '<auto>'}...")
-        if provider:
-            prov = provider.strip().lower()
-            if prov == "ollama":
-                try:
-                    from llm.ollama_client import OllamaClient as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (ollama).")
-                except Exception as e:
-                    self.logger.info(f"LLM: ollama client unavailable: {e}")
-            elif prov == "openai":
-                try:
-                    from llm.openai_client_compat import LLMClientCompat as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (compat).")
-                except Exception:
-                    try:
-                        from llm.openai_client import LLMClient as _LLM
-                        llm_client = _LLM()
-                        self.logger.info("LLM: client ready (native).")
-                    except Exception as e:
-                        self.logger.info(f"LLM: openai client unavailable: {e}")
-            else:
-                self.logger.info(f"LLM: unknown provider '{provider}', skipping client setup")
-        else:
-            # auto-detect: try OpenAI compat, then native, then Ollama
-            try:
-                from llm.openai_client_compat import LLMClientCompat as _LLM
-                llm_client = _LLM()
-                self.logger.info("LLM: client ready (compat).")
-            except Exception as e1:
-                try:
-                    from llm.openai_client import LLMClient as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (native).")
-                except Exception as e2:
-                    try:
-                        from llm.ollama_client import OllamaClient as _LLM
-                        llm_client = _LLM()
-                        self.logger.info("LLM: client ready (ollama).")
-                    except Exception as e3:
-                        self.logger.info(f"LLM: client unavailable ({e1} / {e2} / {e3})")
+        llm_client = _get_llm(provider, self.logger)
 
         text = ""
         used = "none"
@@ -735,14 +1110,31 @@ class XMLProgram:
 
 
 
+    def _build_ext_plan(self, node) -> tuple:
+        """Pre-parse the static parts of an <extnode> once per element."""
+        args = []
+        for k,v in node.attrib.items():
+            if k in _EXT_RESERVED:
+                continue
+            is_list = k.endswith("_list") or k in {"disciplines","subtopics"}
+            if "${" in v:
+                args.append((k, v, is_list, True))
+            elif is_list:
+                args.append((k, [p.strip() for p in v.split(",") if p.strip()], True, False))
+            else:
+                args.append((k, _smart_cast(v), False, False))
+        separator = (node.get("separator") or "").encode("utf-8").decode("unicode_escape")
+        return (node.get("module"), node.get("class"), node.get("method"), node.get("func"),
+                node.get("output_var"), (node.get("output_format") or "text").lower(),
+                separator, tuple(args))
+
     def handle_extnode(self, node: ET.Element):
-        mod_name = node.get("module"); cls_name = node.get("class"); method = node.get("method")
-        out_var = node.get("output_var")
+        plan = self._ext_plans.get(id(node))
+        if plan is None:
+            plan = self._ext_plans[id(node)] = self._build_ext_plan(node)
+        mod_name, cls_name, method, func_name, out_var, out_fmt, separator, args = plan
         if not mod_name:
             self.logger.info("<extnode> requires module"); return
-        # optional output formatting
-        separator = (node.get("separator") or "").encode("utf-8").decode("unicode_escape")
-        out_fmt = (node.get("output_format") or "text").lower()
         # extract and log LLM parameters from XML node
         model = node.get("model")
         temp_raw = node.get("temperature")
@@ -757,61 +1149,20 @@ class XMLProgram:
         provider = node.get("provider")  # 'openai' or 'ollama'
         self.logger.info(f"EXTNODE LLM params: model={model}, temperature={temperature}, provider={provider}")
 
-        # Collect kwargs from XML (with substitutions and simple casts)
+        # Collect kwargs from the plan; only templated values are re-evaluated
         kw: Dict[str, Any] = {}
-        for k,v in node.attrib.items():
-            if k in {"module","class","method","func","output_var","output_format","separator"}: 
+        for k, v, is_list, dynamic in args:
+            if not dynamic:
+                kw[k] = list(v) if is_list else v
                 continue
             vv = _substitute_vars(v, self.variables)
-            if k.endswith("_list") or k in {"disciplines","subtopics"}:
+            if is_list:
                 kw[k] = [p.strip() for p in vv.split(",") if p.strip()]
             else:
                 kw[k] = _smart_cast(vv)
 
         # select LLM client based on provider: 'openai', 'ollama', or auto
-        llm_client = None
-        self.logger.info(f"LLM: creating client for provider={provider or '<auto>'}...")
-        if provider:
-            prov = provider.strip().lower()
-            if prov == "ollama":
-                try:
-                    from llm.ollama_client import OllamaClient as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (ollama).")
-                except Exception as e:
-                    self.logger.info(f"LLM: ollama client unavailable: {e}")
-            elif prov == "openai":
-                try:
-                    from llm.openai_client_compat import LLMClientCompat as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (compat).")
-                except Exception:
-                    try:
-                        from llm.openai_client import LLMClient as _LLM
-                        llm_client = _LLM()
-                        self.logger.info("LLM: client ready (native).")
-                    except Exception as e:
-                        self.logger.info(f"LLM: openai client unavailable: {e}")
-            else:
-                self.logger.info(f"LLM: unknown provider '{provider}', skipping client setup")
-        else:
-            # auto-detect: try OpenAI compat, then native, then Ollama
-            try:
-                from llm.openai_client_compat import LLMClientCompat as _LLM
-                llm_client = _LLM()
-                self.logger.info("LLM: client ready (compat).")
-            except Exception as e1:
-                try:
-                    from llm.openai_client import LLMClient as _LLM
-                    llm_client = _LLM()
-                    self.logger.info("LLM: client ready (native).")
-                except Exception as e2:
-                    try:
-                        from llm.ollama_client import OllamaClient as _LLM
-                        llm_client = _LLM()
-                        self.logger.info("LLM: client ready (ollama).")
-                    except Exception as e3:
-                        self.logger.info(f"LLM: client unavailable ({e1} / {e2} / {e3})")
+        llm_client = _get_llm(provider, self.logger)
 
         # Import target module
         try:
@@ -822,7 +1173,6 @@ class XMLProgram:
             return
 
         # Resolve call target
-        func_name = node.get("func")
         result = None
         try:
             if func_name:
@@ -910,58 +1260,41 @@ class XMLProgram:
 
     # ---- dispatcher ----
     def _exec_node(self, node):
-        # Exit immediately if exit_flag is set
-        if self.exit_flag:
+        # Exit immediately if exit_flag is set (plain attributes: hot path)
+        if self._exit_flag:
             raise SystemExit
-        if self.restart_requested:
+        if self._restart_requested:
             raise RestartRequested()
-        tag = getattr(node, "tag", None)
-        if not isinstance(tag, str):
+        tagl = self._tag_of(node)
+        if not tagl:
             return  # skip comments/PI
-        # expose current node info for UIs
-        try:
-            self.variables["_CURRENT_NODE_TAG"] = tag.lower()
-        except Exception:
-            pass
-        self._pause_gate()
-        tagl = tag.lower()
-        if   tagl=="set": self.handle_set(node)
-        elif tagl=="wait": self.handle_wait(node)
-        elif tagl=="shell": self.handle_shell(node)
-        elif tagl=="hotkey": self.handle_hotkey(node)
-        elif tagl=="type": self.handle_type(node)
-        elif tagl=="click": self.handle_click(node)
-        elif tagl=="focus": self.handle_focus(node)
-        elif tagl=="if": self.handle_if(node)
-        elif tagl=="repeat": self.handle_repeat(node)
-        elif tagl=="list": self.handle_list(node)
-        elif tagl=="func": self.handle_func(node)
-        elif tagl=="call": self.handle_call(node)
-        elif tagl == "llmcall": self.handle_llmcall(node)
-        elif tagl=="foreach": self.handle_foreach(node)
-        elif tagl=="extnode": self.handle_extnode(node)
-        elif tagl=="voice_event": self.handle_voice_event(node)
-        elif tagl=="voice_poll": self.handle_voice_poll(node)
-        else:
-            for ch in list(node): self._exec_node(ch)
+        # expose current node info for UIs (always a global slot)
+        self.variables.maps[-1]["_CURRENT_NODE_TAG"] = tagl
+        # single gate per node; only enter the blocking loop when paused
+        if self._pause_evt.is_set():
+            self._pause_gate()
+        self._DISPATCH.get(tagl, XMLProgram._exec_children)(self, node)
 
     def run(self):
+        global _ACTIVE_PROGRAM
         # Load XML and initialize screen defaults and hotkeys
         self._load_xml()
+        _ACTIVE_PROGRAM = weakref.ref(self)
+        if HOTKEY_WAKE_EVENT is not None:
+            HOTKEY_WAKE_EVENT.set()  # forward hotkeys pressed before the program was published
         try:
             self._suppress_hotkeys_for(0)
         except Exception:
             pass
         self.logger.info("RUN start")
         try:
-            for node in list(self.tree):
+            for node in self._kids(self.tree):
                 # stop if exit requested
                 if self.exit_flag:
                     self.logger.info("RUN aborted by exit flag")
                     break
-                if not isinstance(getattr(node, "tag", None), str):
-                    continue
-                if node.tag.lower() == "func":
+                tagl = self._tag_of(node)
+                if not tagl or tagl == "func":
                     continue
                 self._exec_node(node)
         except SystemExit:
@@ -969,6 +1302,16 @@ class XMLProgram:
             return
         self.logger.info("RUN end")
 
+    # tag -> unbound handler; keys interned so lookups hit the identity fast path
+    _DISPATCH = {sys.intern(k): v for k, v in {
+        "set": handle_set, "wait": handle_wait, "shell": handle_shell,
+        "hotkey": handle_hotkey, "type": handle_type, "click": handle_click,
+        "focus": handle_focus, "if": handle_if, "repeat": handle_repeat,
+        "list": handle_list, "func": handle_func, "call": handle_call,
+        "llmcall": handle_llmcall, "foreach": handle_foreach, "extnode": handle_extnode,
+        "voice_event": handle_voice_event, "voice_poll": handle_voice_poll,
+    }.items()}
+
 # Entrypoint
 if __name__=="__main__":
     import argparse
@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import os
+import sys
 import re
+import locale
 import time
 import math
 import random
@@ -176,10 +178,11 @@ def _type_text(text: str, mode: str = "type"):
 
 # ---------- LLM fallbacks ----------
 _NUMBER_PREFIX = re.compile(r"""^\s*(?:\d+[\)\.\-:]|[\-\•\*])\s*""", re.X)
+# one pass: leading whitespace + optional "1." / "-" / "•" marker + quotes, and trailing whitespace/quotes
+_CLEAN_RE = re.compile(r"""^\s*(?:(?:\d+[\)\.\-:]|[\-\•\*])\s*)?[\s"'“”‘’]*|[\s"'“”‘’]+$""")
 
 def _cleanup_list_item(s: str) -> str:
-    s = s.strip(); s = _NUMBER_PREFIX.sub("", s)
-    return s.strip(" \t\"'“”‘’")
+    return _CLEAN_RE.sub("", s)
 
 def _llm_generate_list(prompt: str, separator: str = "\n", logger: logging.Logger = _setup_logger()) -> List[str]:
     try:
@@ -189,14 +192,12 @@ def _llm_generate_list(prompt: str, separator: str = "\n", logger: logging.Logge
     except Exception as e:
         logger.info(f"Exception: {e}")
         raw_items = [prompt]
-    out: List[str] = []
-    for it in raw_items or []:
-        s = str(it or "")
-        parts = s.split(separator) if ("\n" in s and len(raw_items)==1) else [s]
-        for p in parts:
-            p = _cleanup_list_item(p)
-            if p: out.append(p)
-    return out
+    raw_items = raw_items or []
+    single = len(raw_items) == 1
+    strs = (it if isinstance(it, str) else str(it or "") for it in raw_items)
+    return [c for s in strs
+              for p in (s.split(separator) if (single and "\n" in s) else (s,))
+              if (c := _cleanup_list_item(p))]
 
 def _llm_generate_text(prompt: str, logger) -> str:
     try:
@@ -574,14 +575,25 @@ class XMLProgram:
             if bg and not out_var:
                 subprocess.Popen(args, creationflags=creationflags)
             else:
-                cp = subprocess.run(args, capture_output=True, text=True, creationflags=creationflags, check=False)
-                stdout = (cp.stdout or "").strip(); stderr = (cp.stderr or "").strip()
+                # Stream stdout instead of buffering it via capture_output;
+                # stderr is drained on a helper thread so neither pipe blocks.
+                # text mode keeps run(text=True) semantics: \r\n is normalised to \n
+                enc = locale.getpreferredencoding(False)
+                p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=creationflags,
+                                     text=True, encoding=enc, errors="replace")
+                err = []
+                t = threading.Thread(target=lambda: err.append(p.stderr.read()), daemon=True); t.start()
+                if out_fmt=="list" and separator=="\n":
+                    lines = (raw.rstrip("\n") for raw in p.stdout)
+                    result = [s for s in lines if s.strip()]
+                else:
+                    stdout = p.stdout.read().strip()
+                    result = [s for s in stdout.split(separator) if s.strip()] if out_fmt=="list" else stdout
+                p.wait(); t.join()
+                stderr = "".join(err).strip()
                 if stderr: self.logger.info(f"SHELL stderr: {stderr}")
                 if out_var is not None:
-                    if out_fmt=="list":
-                        self.variables[out_var] = [s for s in stdout.split(separator) if s.strip()]
-                    else:
-                        self.variables[out_var] = stdout
+                    self.variables[out_var] = result
         except Exception as e:
             self.logger.info(f"SHELL error: {e}")
         self._delays(node)
@@ -619,7 +631,7 @@ class XMLProgram:
         prompt = _substitute_vars(prompt, self.variables)
         if out_fmt=="list":
             items = _llm_generate_list(prompt, separator=sep, logger=self.logger)
-            clean = [_cleanup_list_item(str(s)) for s in items if _cleanup_list_item(str(s))]
+            clean = [c for s in items if (c := _cleanup_list_item(s if isinstance(s, str) else str(s)))]
             self.variables[out_var] = clean
         else:
             text = _llm_generate_text(prompt, self.logger)
@@ -738,24 +750,26 @@ class XMLProgram:
     def _exec_node(self, node: ET.Element):
         self._pause_gate()
         tag = node.tag if isinstance(getattr(node, "tag", None), str) else ""
-        tagl = tag.lower()
-        if tagl == "set": self.handle_set(node)
-        elif tagl == "if": self.handle_if(node); return
-        elif tagl == "voice_poll": self.handle_voice_poll(node)
-        elif tagl == "check": self.handle_check(node)
-        elif tagl == "type": self.handle_type(node)
-        elif tagl == "click": self.handle_click(node)
+        # interned so the literal compares below hit the identity fast path;
+        # branches are ordered by tag frequency across the bundled XML programs
+        tagl = sys.intern(tag.lower())
+        if tagl == "wait": self.handle_wait(node)
+        elif tagl == "set": self.handle_set(node)
         elif tagl == "hotkey": self.handle_hotkey(node)
-        elif tagl == "shell": self.handle_shell(node)
-        elif tagl == "focus": self.handle_focus(node)
-        elif tagl == "llmcall": self.handle_llmcall(node)
-        elif tagl == "foreach": self.handle_foreach(node)
+        elif tagl == "click": self.handle_click(node)
         elif tagl == "func": self.handle_func(node)
         elif tagl == "call": self.handle_call(node)
+        elif tagl == "type": self.handle_type(node)
         elif tagl == "repeat": self.handle_repeat(node)
-        elif tagl == "wait": self.handle_wait(node)
+        elif tagl == "if": self.handle_if(node); return
+        elif tagl == "foreach": self.handle_foreach(node)
+        elif tagl == "llmcall": self.handle_llmcall(node)
+        elif tagl == "shell": self.handle_shell(node)
         elif tagl == "extnode": self.handle_extnode(node)
+        elif tagl == "focus": self.handle_focus(node)
         elif tagl == "voice_event": self.handle_voice_event(node)
+        elif tagl == "voice_poll": self.handle_voice_poll(node)
+        elif tagl == "check": self.handle_check(node)
         else: pass
 
     # ---------- Run ----------
@@ -1,4 +1,9 @@
-disciplines = [
+import random
+
+# private generator so prompt sampling doesn't share the global random state
+_RNG = random.Random()
+
+disciplines = (
     "Physics", "Mathematics", "Computer Science", "Biology", "Chemistry",
     "Economics", "Psychology", "Philosophy", "Linguistics", "History",
     "Geography", "Engineering", "Medicine", "Astronomy", "Sociology",
@@ -39,7 +44,7 @@ disciplines = [
     "Public Health", "Health Policy", "Global Health", "Occupational Health", "Environmental Health",
     "Cryptography", "Network Security", "Ethical Hacking", "Blockchain Technology", "Quantum Computing",
     "Demography", "Population Studies", "Migration Studies", "Urban Studies", "Rural Sociology"
-]
+)
 
 subtopics = {
     "Physics": ["Quantum Mechanics", "Thermodynamics", "Electrodynamics", "Astrophysics", "Mechanics", "Optics", "Relativistic Physics", "Solid State Physics", "Nuclear Physics", "Statistical Physics"],
@@ -56,34 +61,46 @@ subtopics = {
     # For brevity, I'll provide a pattern for the remaining disciplines
 }
 
-# Generate subtopics for remaining disciplines programmatically
+# Subtopics for disciplines without an explicit list
 default_subtopics = ["Introduction", "Theory", "Applications", "History", "Modern Developments", "Experimental Methods", "Interdisciplinary Approaches", "Case Studies", "Advanced Topics", "Emerging Trends"]
-for discipline in disciplines:
-    if discipline not in subtopics:
-        subtopics[discipline] = default_subtopics
-        
-def generate_prompt(discipline, used_terms=None):
-    import random
 
-    subtopic = random.choice(subtopics.get(discipline, ["any subtopic"]))
-    complexity = random.choice(["beginner", "intermediate", "advanced", "research-level"])
-    aspect = random.choice(["theoretical", "applied", "historical", "modern", "experimental"])
-    style = random.choice(["academic", "popular science", "practical", "innovative"])
-    num_terms = random.randint(5, 15)
-    seed = random.randint(1, 10000)
+# Prompt template split at its insertion points (None slots), filled per call
+# and joined once.
+_TMPL_PARTS = (
+    "\n    You are an expert in ", None, ". \n"
+    "    Generate a list of ", None, " unique terms or concepts related to ", None,
+    ", focusing on the subtopic '", None, "'. \n"
+    "    The terms should be of ", None, " complexity, represent ", None,
+    " aspects, and align with a ", None, " style. \n"
+    "    Each term must include a brief description (1-2 sentences). \n"
+    "    Ensure the terms are maximally diverse and include rare or unconventional concepts. \n"
+    "    Use the random seed value ", None, " to ensure uniqueness. \n"
+    "    Format the response as a numbered list, with each item starting with the term in bold (**term**).\n"
+    "    ",
+)
 
-    prompt = f"""
-    You are an expert in {discipline}. 
-    Generate a list of {num_terms} unique terms or concepts related to {discipline}, focusing on the subtopic '{subtopic}'. 
-    The terms should be of {complexity} complexity, represent {aspect} aspects, and align with a {style} style. 
-    Each term must include a brief description (1-2 sentences). 
-    Ensure the terms are maximally diverse and include rare or unconventional concepts. 
-    Use the random seed value {seed} to ensure uniqueness. 
-    Format the response as a numbered list, with each item starting with the term in bold (**term**).
-    """
+def generate_prompt(discipline, used_terms=None, rng=None):
+    rng = rng or _RNG
+    subtopic = rng.choice(subtopics.get(discipline, default_subtopics))
+    complexity = rng.choice(["beginner", "intermediate", "advanced", "research-level"])
+    aspect = rng.choice(["theoretical", "applied", "historical", "modern", "experimental"])
+    style = rng.choice(["academic", "popular science", "practical", "innovative"])
+    num_terms = rng.randint(5, 15)
+    seed = rng.randint(1, 10000)
 
+    parts = list(_TMPL_PARTS)
+    parts[1] = discipline
+    parts[3] = str(num_terms)
+    parts[5] = discipline
+    parts[7] = subtopic
+    parts[9] = complexity
+    parts[11] = aspect
+    parts[13] = style
+    parts[15] = str(seed)
     if used_terms:
-        prompt += f"\nAvoid the following terms: {', '.join(used_terms)}."
+        parts.append("\nAvoid the following terms: ")
+        parts.append(", ".join(used_terms))
+        parts.append(".")
 
-    return prompt
+    return "".join(parts)
     
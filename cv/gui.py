@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import sys
+import threading
+from collections import defaultdict
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtGui import QImage 
@@ -12,6 +14,7 @@ from hash_image import hash_image
 from PyQt5.QtCore import Qt
 
 ghash_value = ""
+GRID_CELL = 64
 
 def convertQImageToMat(incomingImage):
     '''  Converts a QImage into an opencv MAT format  '''
@@ -26,6 +29,104 @@ def convertQImageToMat(incomingImage):
     arr = np.array(ptr).reshape(height, width, 4)  #  Copies the data
     return arr
 
+_OCR_READER = None
+_OCR_TRIED = False
+_OCR_LOCK = threading.Lock()
+
+def _make_reader():
+    # Attempt to initialize easyocr reader, but guard against binary
+    # incompatibilities (NumPy 2 vs packages compiled against NumPy 1.x).
+    try:
+        try:
+            major = int(str(np.__version__).split('.')[0])
+        except Exception:
+            major = 0
+        if major >= 2:
+            # avoid importing easyocr/scipy which may be incompatible with NumPy 2.x
+            print('Skipping easyocr import: detected numpy version', np.__version__)
+            return None
+        import easyocr
+        return easyocr.Reader(['ru', 'en'], gpu=False)
+    except Exception as _e:
+        # any import error -> disable OCR gracefully
+        print('easyocr init failed:', _e)
+        return None
+
+def _get_reader():
+    """Shared easyocr Reader, built (or given up on) once per process."""
+    global _OCR_READER, _OCR_TRIED
+    with _OCR_LOCK:
+        if not _OCR_TRIED:
+            _OCR_READER = _make_reader()
+            _OCR_TRIED = True
+        return _OCR_READER
+
+def _join_ocr(res):
+    if not res:
+        return "", 0.0
+    texts = [t[1] for t in res if t and len(t) > 1]
+    confs = [float(t[2]) for t in res if t and len(t) > 2]
+    return " ".join(texts), (sum(confs)/len(confs) if confs else 0.0)
+
+def _pad_to_common(crops):
+    # readtext_batched needs equally sized inputs: pad each crop (top-left
+    # anchored, so OCR boxes stay valid) with its own mean border colour.
+    H = max(c.shape[0] for c in crops)
+    W = max(c.shape[1] for c in crops)
+    out = []
+    for c in crops:
+        border = np.concatenate([c[0], c[-1], c[:, 0], c[:, -1]]).mean(axis=0)
+        canvas = np.empty((H, W, 3), dtype=c.dtype)
+        canvas[:] = border.astype(c.dtype)
+        canvas[:c.shape[0], :c.shape[1]] = c
+        out.append(canvas)
+    return out
+
+def ocr_rects(arr, rects, batch_size=16):
+    """OCR every (x, y, w, h) crop of arr (HxWx3 BGR); returns [(text, conf)] per rect.
+
+    Crops are views into arr; they are sorted by area so each readtext_batched
+    call pads similar sizes together.
+    """
+    out = [("", 0.0)] * len(rects)
+    reader = _get_reader()
+    if reader is None:
+        return out
+    # EasyOCR wants RGB: reorder channels once for the whole image, not per crop
+    arr = np.ascontiguousarray(arr[..., ::-1])
+    crops = [arr[y:y+h, x:x+w] for (x, y, w, h) in rects]
+    order = sorted((i for i, c in enumerate(crops) if c.size), key=lambda i: crops[i].shape[0] * crops[i].shape[1])
+    for s in range(0, len(order), batch_size):
+        idx = order[s:s+batch_size]
+        try:
+            res = reader.readtext_batched(_pad_to_common([crops[i] for i in idx]), batch_size=batch_size)
+        except Exception:
+            res = []
+            for i in idx:
+                try:
+                    res.append(reader.readtext(np.ascontiguousarray(crops[i])))
+                except Exception:
+                    res.append([])
+        for i, r in zip(idx, res):
+            out[i] = _join_ocr(r)
+    return out
+
+class OcrWorker(QtCore.QThread):
+    """Runs ocr_rects off the GUI thread and emits [(text, conf)] per rect."""
+    done = QtCore.pyqtSignal(list)
+
+    def __init__(self, arr, rects, parent=None):
+        super().__init__(parent)
+        self.arr = arr
+        self.rects = rects
+
+    def run(self):
+        try:
+            self.done.emit(ocr_rects(self.arr, self.rects))
+        except Exception as e:
+            print('OCR worker failed:', e)
+            self.done.emit([("", 0.0)] * len(self.rects))
+
 class PerceiveWindow(QtWidgets.QMainWindow):
 
     
@@ -41,18 +142,36 @@ class PerceiveWindow(QtWidgets.QMainWindow):
         self.words = words
         # will hold OCR results as list of dicts: {x,y,w,h,text,conf}
         self.rects_texts = []
+        self._ocr_lock = threading.Lock()
        
         for r in self.rects:
             self.qrects.append(self.tuple_to_qrect(r))
+        # bucket grid for hover hit-testing: cell -> indexes of rects overlapping it
+        self._grid = defaultdict(list)
+        for i, qr in enumerate(self.qrects):
+            for cx in range(qr.left() // GRID_CELL, qr.right() // GRID_CELL + 1):
+                for cy in range(qr.top() // GRID_CELL, qr.bottom() // GRID_CELL + 1):
+                    self._grid[(cx, cy)].append(i)
         #print(self.rects)
        # self.qrects = self.remove_contained_rectangles(self.qrects)
       
         #return
         self.qimg = QImage(img_path)
+        # BGR ndarray for OCR/hashing; crops are views into it. The QImage is
+        # only used for drawing.
+        self._cv_img = cv2.imread(img_path)
+        if self._cv_img is None:
+            self._cv_img = convertQImageToMat(self.qimg)[..., :3]
         #self.highlighted_indexes = self.find_image_hashes(known_image_hashes)
         #print(self.highlighted_indexes)
         self.setMouseTracking(True)
         self.last_pos = QtCore.QPoint()
+        self._hovered = set()
+        # paint resources, built once instead of per rect per frame
+        self._pen_red = QtGui.QPen(QtGui.QColor('red'))
+        self._fill_red = QtGui.QColor(255,0,0,100)
+        self._pen_green = QtGui.QPen(QtGui.QColor('green'))
+        self._fill_green = QtGui.QColor(0,255,0,100)
         
         self.label = QLabel("word", self)
         self.label.setStyleSheet("background-color: red; color: white; font-size: 30px;")
@@ -72,74 +191,71 @@ class PerceiveWindow(QtWidgets.QMainWindow):
       #  self.setAttribute(QtCore.Qt.WA_TranslucentBackground)
        # self.setWindowOpacity(0.9)
         self.showFullScreen()
+        self._build_pixmaps()
+        # no repaint timer: mouse moves and OCR results schedule repaints
+        self._hovered = self._update_hover()
+        # perform OCR on detected rects (best-effort) in a worker thread
+        boxes = [(r.x(), r.y(), r.width(), r.height()) for r in self.qrects]
+        self._ocr_worker = OcrWorker(self._cv_img, boxes, self)
+        self._ocr_worker.done.connect(self._on_ocr_done)
+        self._ocr_worker.start()
 
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update)
-        self.timer.start(10)
-        # perform OCR on detected rects (best-effort)
-        # Attempt to initialize easyocr reader, but guard against binary
-        # incompatibilities (NumPy 2 vs packages compiled against NumPy 1.x).
-        reader = None
-        try:
-            import numpy as _np
-            try:
-                major = int(str(_np.__version__).split('.')[0])
-            except Exception:
-                major = 0
-            if major >= 2:
-                # avoid importing easyocr/scipy which may be incompatible with NumPy 2.x
-                print('Skipping easyocr import: detected numpy version', _np.__version__)
-                reader = None
+    def _on_ocr_done(self, results):
+        # runs on the GUI thread (queued signal)
+        rects_texts = [{
+            'x': r.x(), 'y': r.y(), 'w': r.width(), 'h': r.height(),
+            'text': text, 'conf': conf
+        } for r, (text, conf) in zip(self.qrects, results)]
+        with self._ocr_lock:
+            # store in words mapping for UI label display
+            if self.words is None:
+                self.words = {}
+            for i, d in enumerate(rects_texts):
+                self.words[i] = d['text']
+            self.rects_texts = rects_texts
+        self._hovered = self._update_hover()
+        self.update()
+
+    def _build_pixmaps(self):
+        # plain scaled screenshot, plus a copy with every rect pre-painted green;
+        # paintEvent blits the latter and only repaints hovered rects on top
+        self._bg_pixmap = QtGui.QPixmap.fromImage(self.qimg).scaled(self.size(), Qt.IgnoreAspectRatio, Qt.FastTransformation)
+        self._overlay_pixmap = QtGui.QPixmap(self._bg_pixmap)
+        painter = QtGui.QPainter(self._overlay_pixmap)
+        for qr in self.qrects:
+            painter.fillRect(qr, self._fill_green)
+        painter.setPen(self._pen_green)
+        painter.drawRects(self.qrects)
+        painter.end()
+
+    def _update_hover(self):
+        # rects under the cursor (via the bucket grid); the last one wins the label
+        with self._ocr_lock:
+            words = self.words
+        pos = self.last_pos
+        cell = self._grid.get((pos.x() // GRID_CELL, pos.y() // GRID_CELL), ())
+        hovered = [i for i in cell if self.qrects[i].contains(pos)]
+        for i in hovered:
+            self.selected_rect = self.qrects[i]
+            if words!= None:
+                if i in words:
+                  self.label.setText(f"{i}:{words[i]}")
             else:
-                import easyocr
-                reader = easyocr.Reader(['ru', 'en'], gpu=False)
-        except Exception as _e:
-            # any import error -> disable OCR gracefully
-            print('easyocr init failed:', _e)
-            reader = None
+                self.label.setText(f"{i}")
+        return set(hovered)
 
-        try:
-            # for each rect, crop and run OCR
-            for i, r in enumerate(self.qrects):
-                try:
-                    cropped_qimg = self.crop_image(self.qimg, r)
-                    arr = convertQImageToMat(cropped_qimg)  # RGBA
-                    # convert RGBA -> RGB
-                    try:
-                        img_rgb = cv2.cvtColor(arr, cv2.COLOR_RGBA2RGB)
-                    except Exception:
-                        img_rgb = arr[..., :3]
-                    text = ""
-                    conf = 0.0
-                    if reader is not None:
-                        try:
-                            res = reader.readtext(img_rgb)
-                            if res:
-                                texts = [t[1] for t in res if t and len(t) > 1]
-                                confs = [float(t[2]) for t in res if t and len(t) > 2]
-                                text = " ".join(texts)
-                                conf = sum(confs)/len(confs) if confs else 0.0
-                        except Exception:
-                            text = ""
-                    # store in words mapping for UI label display
-                    if self.words is None:
-                        self.words = {}
-                    self.words[i] = text
-                    self.rects_texts.append({
-                        'x': r.x(), 'y': r.y(), 'w': r.width(), 'h': r.height(),
-                        'text': text, 'conf': conf
-                    })
-                except Exception:
-                    continue
-        except Exception:
-            pass
+    def closeEvent(self, event):
+        # don't let Qt destroy a running QThread
+        worker = getattr(self, '_ocr_worker', None)
+        if worker is not None and worker.isRunning():
+            worker.wait()
+        super().closeEvent(event)
     
     def find_image_hashes(self, know_image_hashes):
         index = 0
         indexes = []
         for r in self.qrects:
-            cropped_image = self.crop_image(self.qimg, r)
-            hash_value = hash_image(convertQImageToMat(cropped_image))
+            hash_value = hash_image(self._crop_cv(r))
             if hash_value in know_image_hashes:
                 indexes.append(index)
             index = index + 1
@@ -147,23 +263,35 @@ class PerceiveWindow(QtWidgets.QMainWindow):
    # def update(self):
    #     self.repaint()
     def remove_contained_rectangles(self, rects):
-        new_rects = []   
-        for rect in rects:
-            is_contained = False
-            for other_rect in rects:         
-                if other_rect != rect and other_rect.contains(rect):
-                    is_contained = True
-                    break    
-            if not is_contained:
-                new_rects.append(rect)
+        n = len(rects)
+        if n < 32:
+            # small inputs: plain loop beats numpy setup; the QRect != check
+            # (identical rects don't count) only runs once containment holds
+            keep = [True] * n
+            for i in range(n):
+                ri = rects[i]
+                for j in range(n):
+                    if i != j and rects[j].contains(ri) and rects[j] != ri:
+                        keep[i] = False
+                        break
+            return [r for r, k in zip(rects, keep) if k]
+        R = np.array([(r.x(), r.y(), r.x()+r.width(), r.y()+r.height()) for r in rects], dtype=np.int32)
+        x1, y1, x2, y2 = R.T
+        # contains[j, i]: rect j contains rect i; identical rects don't count
+        contains = (x1[:, None] <= x1[None, :]) & (y1[:, None] <= y1[None, :]) & \
+                   (x2[:, None] >= x2[None, :]) & (y2[:, None] >= y2[None, :])
+        contains &= (R[:, None, :] != R[None, :, :]).any(axis=2)
+        keep = ~contains.any(axis=0)
+        return [rects[i] for i in np.nonzero(keep)[0]]
     
-        return new_rects
-    
-    def crop_image(self, image, rect):
+    def _crop_cv(self, rect):
+        # zero-copy BGR view for OCR/hashing
         x, y, width, height = rect.x(), rect.y(), rect.width(), rect.height()
-        cropped_image = QtGui.QImage(width, height, QtGui.QImage.Format_RGBA8888)
-        cropped_image = image.copy(x, y, width, height)
-        return cropped_image
+        return self._cv_img[y:y+height, x:x+width]
+
+    def crop_image(self, image, rect):
+        # QImage copy; drawing/debug only, numeric paths use _crop_cv
+        return image.copy(rect.x(), rect.y(), rect.width(), rect.height())
 
     def tuple_to_qrect(self, tuple):
         x, y, width, height = tuple
@@ -171,38 +299,33 @@ class PerceiveWindow(QtWidgets.QMainWindow):
 
     def mouseMoveEvent(self, event):
         self.last_pos = event.pos()
+        old = self._hovered
+        self._hovered = self._update_hover()
+        if self._hovered != old:
+            # repaint only the rects whose highlight changed
+            region = QtGui.QRegion()
+            for i in old | self._hovered:
+                region = region.united(self.qrects[i].adjusted(-1, -1, 1, 1))
+            self.update(region)
         
     def mousePressEvent(self, event):
-        cropped_image = self.crop_image(self.qimg, self.selected_rect)
-        #cropped_image.save("cropped.png")
-        hash_value = hash_image(convertQImageToMat(cropped_image))
+        #self.crop_image(self.qimg, self.selected_rect).save("cropped.png")
+        hash_value = hash_image(self._crop_cv(self.selected_rect))
         self.hash = hash_value
         app = QtWidgets.QApplication.instance()
         app.closeAllWindows()
         
     def paintEvent(self, event):
         painter = QtGui.QPainter(self)
-        rect = self.rect()
-        painter.drawImage(rect, self.qimg)
-        index = 0
-        for i, qr in enumerate(self.qrects):
-          
-            if qr.contains(self.last_pos):
-                painter.setPen(QtGui.QPen(QtGui.QColor('red')))
-                painter.fillRect(qr, QtGui.QColor(255,0,0,100))
-                self.selected_rect = qr
-                if self.words!= None:
-                    if i in self.words:
-                      self.label.setText(f"{i}:{self.words[i]}")
-                      # self.label.setText(f"{i}")
-                      
-                else:
-                    self.label.setText(f"{i}")
-            else:
-                painter.setPen(QtGui.QPen(QtGui.QColor('green')))
-                painter.fillRect(qr, QtGui.QColor(0,255,0,100))
+        if self._bg_pixmap.size() != self.size():
+            self._build_pixmaps()
+        painter.drawPixmap(0, 0, self._overlay_pixmap)
+        painter.setPen(self._pen_red)
+        for i in sorted(self._hovered):
+            qr = self.qrects[i]
+            painter.drawPixmap(qr, self._bg_pixmap, qr)
+            painter.fillRect(qr, self._fill_red)
             painter.drawRect(qr)
-            index = index + 1
             
 
 def get_image_hash_window():
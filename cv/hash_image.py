@@ -1,20 +1,35 @@
 # -*- coding: utf-8 -*-
 import cv2
 import struct
+import numpy as np
+
+try:
+    import numba
+except Exception:
+    numba = None
 
 def double_to_hex(f):
     return hex(struct.unpack('<Q', struct.pack('<d', f))[0])
 
+def _hash_kernel(image):
+    # same summation order as the original loop (no fastmath) so hashes stay bit-identical
+    hash_value = 0.0
+    for i in range(8):
+        for j in range(8):
+            hash_value += (image[i, j] / 2) * 2.0 ** (8 * i + j)
+    return hash_value
+
+if numba is not None:
+    try:
+        _jit_kernel = numba.njit(cache=True)(_hash_kernel)
+        _jit_kernel(np.zeros((8, 8), dtype=np.uint8))  # compile at import, not on first click
+        _hash_kernel = _jit_kernel
+    except Exception:
+        pass
+
 def hash_image(image):
 
     image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     image = cv2.resize(image, (8, 8))
 
-    hash_value = 0
-    for i in range(8):
-        for j in range(8):
-            hash_value += (image[i][j]/2) * 2**(8 * i + j)
-    hex_string = double_to_hex(hash_value)
-
-    return hex_string
-
+    return double_to_hex(_hash_kernel(image))
@@ -22,6 +22,8 @@ SKIP_EVENT = threading.Event()
 PAUSE_TOGGLE_EVENT = threading.Event()
 # Event for exit hotkey (Esc or Ctrl+Q)
 EXIT_EVENT = threading.Event()
+# Set together with any of the above so a consumer can block on a single event
+WAKE_EVENT = threading.Event()
 
 _started = False
 
@@ -75,6 +77,7 @@ def _msg_loop():
                     SKIP_EVENT.set()
                 elif hotkey_id in (3, 4):
                     EXIT_EVENT.set()
+                WAKE_EVENT.set()
             user32.TranslateMessage(ctypes.byref(msg))
             user32.DispatchMessageW(ctypes.byref(msg))
         except Exception as e:
@@ -6,36 +6,78 @@ def _is_windows() -> bool:
     return sys.platform.startswith("win")
 
 
-def _get_foreground_langid_windows() -> int | None:
+# user32 entry points bound once with explicit prototypes, so each probe is
+# a plain foreign call without per-call argument inference.
+_KLF_ACTIVATE = 0x00000001
+_WM_INPUTLANGCHANGEREQUEST = 0x0050
+_US_ENGLISH_KLID = "00000409"
+
+_user32 = None
+if _is_windows():
     try:
         import ctypes
         from ctypes import wintypes
 
-        user32 = ctypes.windll.user32
+        _user32 = ctypes.WinDLL("user32", use_last_error=True)
+
+        _GetForegroundWindow = _user32.GetForegroundWindow
+        _GetForegroundWindow.argtypes = []
+        _GetForegroundWindow.restype = wintypes.HWND
+
+        _GetWindowThreadProcessId = _user32.GetWindowThreadProcessId
+        _GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.POINTER(wintypes.DWORD)]
+        _GetWindowThreadProcessId.restype = wintypes.DWORD
+
+        _GetKeyboardLayout = _user32.GetKeyboardLayout
+        _GetKeyboardLayout.argtypes = [wintypes.DWORD]
+        _GetKeyboardLayout.restype = wintypes.HKL
+
+        _LoadKeyboardLayoutW = _user32.LoadKeyboardLayoutW
+        _LoadKeyboardLayoutW.argtypes = [wintypes.LPCWSTR, wintypes.UINT]
+        _LoadKeyboardLayoutW.restype = wintypes.HKL
+
+        _PostMessageW = _user32.PostMessageW
+        _PostMessageW.argtypes = [wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        _PostMessageW.restype = wintypes.BOOL
+    except Exception:
+        _user32 = None
 
-        GetForegroundWindow = user32.GetForegroundWindow
-        GetWindowThreadProcessId = user32.GetWindowThreadProcessId
-        GetKeyboardLayout = user32.GetKeyboardLayout
-        AttachThreadInput = user32.AttachThreadInput
-        GetCurrentThreadId = ctypes.windll.kernel32.GetCurrentThreadId
 
-        hwnd = GetForegroundWindow()
+def _foreground_thread_windows() -> tuple[int, int] | None:
+    """(hwnd, thread_id) of the foreground window, or None."""
+    if _user32 is None:
+        return None
+    try:
+        hwnd = _GetForegroundWindow()
         if not hwnd:
             return None
 
-        pid = wintypes.DWORD()
-        thread_id = GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        thread_id = _GetWindowThreadProcessId(hwnd, None)
         if not thread_id:
             return None
+        return hwnd, thread_id
+    except Exception:
+        return None
+
 
-        # Try to get the layout of the foreground thread
-        hkl = GetKeyboardLayout(thread_id)
-        langid = hkl & 0xFFFF
-        return langid
+def _probe_langid_for_thread(thread_id: int) -> int | None:
+    try:
+        hkl = _GetKeyboardLayout(thread_id)
+        if not hkl:
+            return None
+        return hkl & 0xFFFF
     except Exception:
         return None
 
 
+def _get_foreground_langid_windows() -> int | None:
+    fg = _foreground_thread_windows()
+    if fg is None:
+        return None
+    # Try to get the layout of the foreground thread
+    return _probe_langid_for_thread(fg[1])
+
+
 def _primary_langid(langid: int) -> int:
     # PRIMARYLANGID macro: low 10 bits
     return langid & 0x03FF
@@ -51,16 +93,41 @@ def _is_english_langid(langid: int) -> bool:
     return _primary_langid(langid) == 0x09
 
 
+def _request_english_layout_windows() -> bool:
+    """Ask the foreground window to switch to US English; True if the request was posted."""
+    if _user32 is None:
+        return False
+    try:
+        hwnd = _GetForegroundWindow()
+        if not hwnd:
+            return False
+        hkl = _LoadKeyboardLayoutW(_US_ENGLISH_KLID, _KLF_ACTIVATE)
+        if not hkl:
+            return False
+        return bool(_PostMessageW(hwnd, _WM_INPUTLANGCHANGEREQUEST, 0, hkl))
+    except Exception:
+        return False
+
+
 def ensure_english_layout(max_attempts: int = 6, delay: float = 0.15) -> None:
     """Ensure the active keyboard layout is English on Windows.
 
-    - If current layout is Russian, toggles layouts via Win+Space until English.
+    - If current layout is not English, loads/activates US English and posts
+      WM_INPUTLANGCHANGEREQUEST to the foreground window.
+    - Falls back to toggling layouts via Win+Space if that request can't be posted.
     - On non-Windows platforms, no-op.
     - Best-effort; suppresses errors to avoid breaking the CLI.
     """
     if not _is_windows():
         return
 
+    fg = _foreground_thread_windows()
+    langid = _probe_langid_for_thread(fg[1]) if fg else None
+    if langid is not None and _is_english_langid(langid):
+        return
+    if _request_english_layout_windows():
+        return
+
     try:
         import pyautogui
     except Exception:
@@ -68,13 +135,13 @@ def ensure_english_layout(max_attempts: int = 6, delay: float = 0.15) -> None:
         return
 
     try:
-        langid = _get_foreground_langid_windows()
-        if langid is not None and _is_english_langid(langid):
-            return
         # If Russian (or unknown but not English), attempt to cycle layouts
         attempts = 0
         while attempts < max_attempts:
-            langid = _get_foreground_langid_windows()
+            # reuse the foreground thread; re-check focus only every 2nd attempt
+            if fg is None or (attempts % 2 and _GetForegroundWindow() != fg[0]):
+                fg = _foreground_thread_windows()
+            langid = _probe_langid_for_thread(fg[1]) if fg else None
             if langid is not None and _is_english_langid(langid):
                 break
             # Press Win+Space to cycle input method
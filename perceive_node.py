@@ -7,18 +7,51 @@ This module is intended to be used from XML as an <extnode>:
 The perceive() method returns a dict with key 'rects' containing a list
 of {x,y,w,h,text,conf} items.
 """
+import os
 from typing import List, Dict, Any
 try:
     from cv.preprocess import detect_words
     import cv2
+    import numpy as np
 except Exception:
     detect_words = None
     cv2 = None
+    np = None
 
 class PerceiveNode:
+    # shared across instances/calls: Reader construction loads the models from disk
+    _reader = None
+    _reader_tried = False
+    _img_cache = (None, None)  # ((path, mtime_ns, size), ndarray)
+
     def __init__(self, llm=None):
         self.llm = llm
 
+    @classmethod
+    def _get_reader(cls):
+        if not cls._reader_tried:
+            cls._reader_tried = True
+            try:
+                import easyocr
+                try:
+                    import torch
+                    use_gpu = bool(torch.cuda.is_available())
+                except Exception:
+                    use_gpu = False
+                cls._reader = easyocr.Reader(['ru','en'], gpu=use_gpu)
+            except Exception:
+                cls._reader = None
+        return cls._reader
+
+    @classmethod
+    def _read_image(cls, path):
+        # reuse the decoded screenshot while the file is unchanged
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if cls._img_cache[0] != key:
+            cls._img_cache = (key, cv2.imread(path))
+        return cls._img_cache[1]
+
     def perceive(self, **kwargs) -> Dict[str, Any]:
         rects: List[tuple] = []
         if detect_words is None:
@@ -33,32 +66,33 @@ class PerceiveNode:
         img = None
         try:
             if cv2 is not None:
-                img = cv2.imread('screenshot.png')
+                img = self._read_image('screenshot.png')
         except Exception:
             img = None
 
-        # Try to import easyocr for OCR
-        try:
-            import easyocr
-            reader = easyocr.Reader(['ru','en'], gpu=False)
-        except Exception:
-            reader = None
+        reader = self._get_reader()
+
+        # one detector+recognizer pass over the whole screenshot; each result is
+        # then assigned to every rect that contains its centroid
+        res = []
+        if reader is not None and img is not None and rects:
+            try:
+                res = [t for t in reader.readtext(img) if t and len(t) > 2]
+            except Exception:
+                res = []
+        if res:
+            cen = np.array([np.asarray(t[0], dtype=float).reshape(-1, 2).mean(axis=0) for t in res])
+            cx, cy = cen[:, 0], cen[:, 1]
 
         for r in rects:
             x,y,w,h = r
             text = ''
             conf = 0.0
-            if reader is not None and img is not None:
-                try:
-                    crop = img[y:y+h, x:x+w]
-                    res = reader.readtext(crop)
-                    if res:
-                        texts = [t[1] for t in res if t and len(t)>1]
-                        confs = [float(t[2]) for t in res if t and len(t)>2]
-                        text = ' '.join(texts)
-                        conf = sum(confs)/len(confs) if confs else 0.0
-                except Exception:
-                    text = ''
+            if res:
+                hit = np.nonzero((cx >= x) & (cx <= x+w) & (cy >= y) & (cy <= y+h))[0]
+                if len(hit):
+                    text = ' '.join(res[i][1] for i in hit)
+                    conf = sum(float(res[i][2]) for i in hit)/len(hit)
             items.append({'x': x, 'y': y, 'w': w, 'h': h, 'text': text, 'conf': conf})
 
         return {'rects': items}
@@ -1,6 +1,7 @@
 # extnodes/rare_terms_node.py
 from __future__ import annotations
-import random, textwrap
+import random, re, textwrap
+from functools import lru_cache
 
 # ——— ШИРОКАЯ КОРЗИНА ДИСЦИПЛИН (можно расширять) ———
 BROAD_DISCIPLINES = [
@@ -74,6 +75,7 @@ def _llm_call(llm, prompt: str, max_tokens=800, temperature=0.7):
                 pass
     return None
 
+@lru_cache(maxsize=256)
 def _compose_prompt(language: str, discipline: str, n: int,
                     include_definitions: bool, rarity: str, ban_jargon: bool) -> str:
     gloss = ("Include a concise 6–12 word plain-language gloss for each term."
@@ -93,23 +95,41 @@ def _compose_prompt(language: str, discipline: str, n: int,
     Do not number the items. No extra commentary before or after.
     """)
 
+# маркеры/нумерация в начале строки и хвостовые пробелы/буллеты — одним проходом
+_RE_LINECLEAN = re.compile(r"^[\s•\t\r0-9.\-)]+|[\s•\t\r]+$")
+
 def _sanitize_lines(text: str) -> list[str]:
-    lines = [ln.strip(" •\t\r") for ln in (text or "").splitlines()]
-    lines = [ln for ln in lines if ln]
-    # убираем маркеры/нумерацию
-    cleaned = []
+    lines = [_RE_LINECLEAN.sub("", ln) for ln in (text or "").splitlines()]
+    # дедуп по регистронезависимой форме (первое вхождение, порядок сохраняется)
+    uniq: dict[str, str] = {}
     for ln in lines:
-        ln = ln.lstrip("0123456789.-) ").strip()
-        cleaned.append(ln)
-    # дедуп по регистронезависимой форме
-    seen = set()
-    uniq = []
-    for ln in cleaned:
-        key = ln.lower()
-        if key not in seen:
-            seen.add(key)
-            uniq.append(ln)
-    return uniq
+        if ln:
+            uniq.setdefault(ln.lower(), ln)
+    return list(uniq.values())
+
+@lru_cache(maxsize=256)
+def _chat_prompt(language: str, density: str, first_gloss: str, simplify_on_confusion: bool) -> str:
+    per_para = {"light":"~1", "medium":"1–2", "high":"2–3"}.get(density, "1–2")
+    gloss_rule = {
+        "none": "Do not add glosses.",
+        "one-gloss": "Give a brief parenthetical gloss the first time each rare term appears; do not repeat later.",
+        "all": "Always add a brief parenthetical gloss for each rare term."
+    }.get(first_gloss, "Give a brief parenthetical gloss the first time each rare term appears; do not repeat later.")
+
+    safety = "Avoid obscure neologisms with no published usage. No slurs or derogatory labels."
+    clarity = "Clarity first; rare wording must not obscure meaning."
+    adapt = "If the user signals confusion, immediately restate with common synonyms."
+
+    prompt = f"""\
+You are a clear, precise conversational partner.
+Language: {language}.
+Style: weave {per_para} rare, domain-appropriate terms per paragraph, naturally.
+Glossing rule: {gloss_rule}
+Priorities: {clarity} {safety}
+Adaptation: {adapt if simplify_on_confusion else ""}
+Do not overdo jargon; choose elegant, meaningful rarity, not noise.
+"""
+    return textwrap.dedent(prompt)
 
 class RareTermsNode:
     """
@@ -181,24 +201,4 @@ class RareTermsNode:
         first_gloss = (kwargs.get("first_gloss") or self.kwargs.get("first_gloss") or "one-gloss").strip()  # none/one-gloss/all
         simplify_on_confusion = _to_bool(kwargs.get("simplify_on_confusion") or self.kwargs.get("simplify_on_confusion"), True)
 
-        per_para = {"light":"~1", "medium":"1–2", "high":"2–3"}.get(density, "1–2")
-        gloss_rule = {
-            "none": "Do not add glosses.",
-            "one-gloss": "Give a brief parenthetical gloss the first time each rare term appears; do not repeat later.",
-            "all": "Always add a brief parenthetical gloss for each rare term."
-        }.get(first_gloss, "Give a brief parenthetical gloss the first time each rare term appears; do not repeat later.")
-
-        safety = "Avoid obscure neologisms with no published usage. No slurs or derogatory labels."
-        clarity = "Clarity first; rare wording must not obscure meaning."
-        adapt = "If the user signals confusion, immediately restate with common synonyms."
-
-        prompt = f"""\
-You are a clear, precise conversational partner.
-Language: {language}.
-Style: weave {per_para} rare, domain-appropriate terms per paragraph, naturally.
-Glossing rule: {gloss_rule}
-Priorities: {clarity} {safety}
-Adaptation: {adapt if simplify_on_confusion else ""}
-Do not overdo jargon; choose elegant, meaningful rarity, not noise.
-"""
-        return textwrap.dedent(prompt)
+        return _chat_prompt(language, density, first_gloss, simplify_on_confusion)
@@ -13,36 +13,41 @@ Designed to be robust: optional packages are used only if present; otherwise fal
 """
 from __future__ import annotations
 import argparse
+import importlib.util
 import json
 import math
 import os
 import sys
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Dict, Tuple, Any, Optional
 
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
 
-# Optional: transformers/torch
-try:
-    from transformers import AutoImageProcessor, AutoModelForObjectDetection
-    HF_AVAILABLE = True
-except Exception:
-    HF_AVAILABLE = False
+def _has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
 
-# Optional: layoutparser + detectron2
-try:
-    import layoutparser as lp
-    LP_AVAILABLE = True
-except Exception:
-    LP_AVAILABLE = False
 
+# Optional heavy packages are only probed here; they are imported on first use
+# so runs that never touch a detector don't pay for torch at startup.
+# Optional: transformers/torch
+HF_AVAILABLE = _has_module('torch') and _has_module('transformers')
+# Optional: layoutparser + detectron2
+LP_AVAILABLE = _has_module('layoutparser')
 # Optional: easyocr
+EASYOCR_AVAILABLE = _has_module('easyocr')
+
+# Optional: orjson (faster JSON read/write)
 try:
-    import easyocr
-    EASYOCR_AVAILABLE = True
+    import orjson
 except Exception:
-    EASYOCR_AVAILABLE = False
+    orjson = None
+# Optional: numba (JIT for the line-grouping sweep)
+NUMBA_AVAILABLE = _has_module('numba')
 
 
 def load_image(path: str) -> Tuple[np.ndarray, Tuple[int,int]]:
@@ -53,45 +58,108 @@ def load_image(path: str) -> Tuple[np.ndarray, Tuple[int,int]]:
     return img, (w, h)
 
 
-def detect_blocks_hf(img: np.ndarray) -> List[Dict[str, Any]]:
-    """Try HF object detection model for layout. Returns list of blocks with bbox and score.
-    bbox coordinates are ints [x1,y1,x2,y2]."""
+_CPU_THREADS: Optional[int] = None
+
+
+def set_cpu_threads(n: Optional[int] = None) -> None:
+    """Cap CPU thread pools (default: half the cores for torch). Takes full effect when
+    called before torch is first imported, which happens lazily in _get_hf/_get_reader."""
+    global _CPU_THREADS
+    _CPU_THREADS = n or max(1, (os.cpu_count() or 2) // 2)
+    os.environ.setdefault('OMP_NUM_THREADS', str(_CPU_THREADS))
+    os.environ.setdefault('MKL_NUM_THREADS', str(_CPU_THREADS))
+    if n:
+        cv2.setNumThreads(n)
+    if 'torch' in sys.modules:
+        _apply_torch_threads()
+
+
+def _apply_torch_threads() -> None:
+    if not _CPU_THREADS:
+        return
+    try:
+        import torch
+    except Exception:
+        return
+    torch.set_num_threads(_CPU_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # only settable before the first inter-op parallel work
+
+
+@lru_cache(maxsize=1)
+def _get_hf():
+    """Processor, model and device for the HF detector; weights stay resident across calls."""
+    import torch
+    from transformers import AutoImageProcessor, AutoModelForObjectDetection
+    _apply_torch_threads()
+    proc = AutoImageProcessor.from_pretrained('microsoft/dit-base-finetuned-doclaynet')
+    model = AutoModelForObjectDetection.from_pretrained('microsoft/dit-base-finetuned-doclaynet')
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model.to(device).eval()
+    if device == 'cuda':
+        # fp16 only on GPU; half precision is slower than fp32 on most CPUs
+        model.half()
+    return proc, model, device
+
+
+@lru_cache(maxsize=1)
+def _get_lp():
+    import layoutparser as lp
+    return lp.Detectron2LayoutModel('lp://PubLayNet/faster_rcnn_R_50_FPN_3x/config')
+
+
+def detect_blocks_hf_batch(imgs: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+    """HF layout detection over several images in one forward pass; one block list per image."""
     if not HF_AVAILABLE:
         raise RuntimeError('HF transformers not available')
-    # use CPU auto model if torch available
     try:
-        proc = AutoImageProcessor.from_pretrained('microsoft/dit-base-finetuned-doclaynet')
-        model = AutoModelForObjectDetection.from_pretrained('microsoft/dit-base-finetuned-doclaynet')
+        proc, model, device = _get_hf()
     except Exception as e:
         raise RuntimeError(f'HF model load failed: {e}')
-    # transformers expects PIL
-    pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    inputs = proc(images=pil, return_tensors='pt')
-    with np.errstate(all='ignore'):
+    import torch
+    # processor accepts HWC uint8 numpy directly; skip the PIL round-trip
+    rgbs = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in imgs]
+    inputs = proc(images=rgbs, return_tensors='pt')
+    inputs = {k: v.to(device, dtype=model.dtype) if v.is_floating_point() else v.to(device) for k, v in inputs.items()}
+    with torch.inference_mode():
         outputs = model(**inputs)
+        if model.dtype != torch.float32:
+            # box decoding/thresholds in fp32
+            for k, v in outputs.items():
+                if torch.is_tensor(v) and v.is_floating_point():
+                    outputs[k] = v.float()
     # postprocess using processor
     try:
-        target_sizes = torch.tensor([pil.size[::-1]])
-        results = proc.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.5)[0]
-    except Exception:
-        # fallback: try using outputs directly
-        results = []
-    blocks: List[Dict[str, Any]] = []
-    for i, (score, label, box) in enumerate(zip(results['scores'], results['labels'], results['boxes'])):
-        x1, y1, x2, y2 = [int(float(v)) for v in box]
-        blocks.append({'block_id': i+1, 'bbox': [x1, y1, x2, y2], 'type': str(int(label)), 'score': float(score)})
-    return blocks
+        target_sizes = torch.tensor([rgb.shape[:2] for rgb in rgbs], device=device)
+        results = proc.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.5)
+    except Exception as e:
+        raise RuntimeError(f'HF post-processing failed: {e}')
+    out = []
+    for res in results:
+        blocks: List[Dict[str, Any]] = []
+        for i, (score, label, box) in enumerate(zip(res['scores'], res['labels'], res['boxes'])):
+            x1, y1, x2, y2 = [int(float(v)) for v in box]
+            blocks.append({'block_id': i+1, 'bbox': [x1, y1, x2, y2], 'type': str(int(label)), 'score': float(score)})
+        out.append(blocks)
+    return out
+
+
+def detect_blocks_hf(img: np.ndarray) -> List[Dict[str, Any]]:
+    """Try HF object detection model for layout. Returns list of blocks with bbox and score.
+    bbox coordinates are ints [x1,y1,x2,y2]."""
+    return detect_blocks_hf_batch([img])[0]
 
 
 def detect_blocks_layoutparser(img: np.ndarray) -> List[Dict[str, Any]]:
     if not LP_AVAILABLE:
         raise RuntimeError('layoutparser not available')
     try:
-        model = lp.Detectron2LayoutModel('lp://PubLayNet/faster_rcnn_R_50_FPN_3x/config')
+        model = _get_lp()
     except Exception as e:
         raise RuntimeError(f'LP model load failed: {e}')
-    pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    layout = model.detect(pil)
+    layout = model.detect(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     blocks = []
     bid = 1
     for r in layout:
@@ -101,19 +169,30 @@ def detect_blocks_layoutparser(img: np.ndarray) -> List[Dict[str, Any]]:
     return blocks
 
 
-def detect_blocks_cv(img: np.ndarray, min_area: int = 1000) -> List[Dict[str, Any]]:
+def detect_blocks_cv(img: np.ndarray, min_area: int = 1000, scale: float = 1.0) -> List[Dict[str, Any]]:
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    th = cv2.bitwise_not(th)
+    # Otsu on full resolution, inverted in the same pass
+    _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    H, W = gray.shape[:2]
+    if 0 < scale < 1:
+        # morphology/contours on a downscaled mask; INTER_AREA + any-ink keeps 1px strokes
+        th = cv2.resize(th, (max(1, int(W*scale)), max(1, int(H*scale))), interpolation=cv2.INTER_AREA)
+        cv2.threshold(th, 0, 255, cv2.THRESH_BINARY, dst=th)
+    else:
+        scale = 1.0
+    sx, sy = W / th.shape[1], H / th.shape[0]
     # dilate to merge text into blocks
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 5))
-    dil = cv2.dilate(th, kernel, iterations=2)
-    contours, _ = cv2.findContours(dil, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # keep the full-resolution merge reach: a k-wide rect grows a blob by k-1 px
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (math.ceil(24*scale) + 1, math.ceil(4*scale) + 1))
+    # in place: the undilated mask isn't needed afterwards
+    cv2.dilate(th, kernel, dst=th, iterations=2)
+    contours, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     blocks = []
     bid = 1
-    H, W = gray.shape[:2]
     for c in contours:
         x, y, w, h = cv2.boundingRect(c)
+        # back to full-resolution coordinates
+        x, y, w, h = int(x*sx), int(y*sy), int(math.ceil(w*sx)), int(math.ceil(h*sy))
         area = w * h
         if area < min_area:
             continue
@@ -127,203 +206,405 @@ def detect_blocks_cv(img: np.ndarray, min_area: int = 1000) -> List[Dict[str, An
     return blocks
 
 
-def run_easyocr(img_path: str, langs: str = 'en') -> List[Dict[str, Any]]:
+@lru_cache(maxsize=4)
+def _get_reader(langs: Tuple[str, ...]):
+    """EasyOCR reader per language set; weights load once per process."""
+    import easyocr
+    _apply_torch_threads()
+    return easyocr.Reader(list(langs), cudnn_benchmark=True)
+
+
+def _langs_key(langs) -> Tuple[str, ...]:
+    return (langs,) if isinstance(langs, str) else tuple(langs)
+
+
+def _quad_bbox(bbox) -> List[int]:
+    try:
+        pts = [(int(p[0]), int(p[1])) for p in bbox]
+    except Exception:
+        pts = []
+    if not pts:
+        return [0, 0, 0, 0]
+    xs = [p[0] for p in pts]; ys = [p[1] for p in pts]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def _tokens_from_easyocr(res) -> List[Dict[str, Any]]:
+    if not res:
+        return []
+    try:
+        # all quads at once: (N, 4, 2) -> per-token min/max corners
+        q = np.asarray([r[0] for r in res], dtype=np.float64).reshape(len(res), -1, 2).astype(np.int64)
+        boxes = np.concatenate([q.min(axis=1), q.max(axis=1)], axis=1).tolist() if q.shape[1] else None
+    except Exception:
+        boxes = None
+    if boxes is None:
+        boxes = [_quad_bbox(r[0]) for r in res]
+    return [{'id': i, 'text': text, 'conf': float(conf), 'bbox': bb}
+            for i, ((_, text, conf), bb) in enumerate(zip(res, boxes))]
+
+
+def run_easyocr(img_path: str, langs: str = 'en', batch_size: int = 1) -> List[Dict[str, Any]]:
     if not EASYOCR_AVAILABLE:
         raise RuntimeError('easyocr not available')
-    reader = easyocr.Reader([langs]) if isinstance(langs, str) else easyocr.Reader(langs)
+    reader = _get_reader(_langs_key(langs))
     img = cv2.imread(img_path)
     if img is None:
         raise FileNotFoundError(img_path)
     rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    res = reader.readtext(rgb)
-    tokens = []
-    for i, (bbox, text, conf) in enumerate(res):
-        try:
-            pts = [(int(p[0]), int(p[1])) for p in bbox]
-        except Exception:
-            pts = []
-        if pts:
-            xs = [p[0] for p in pts]; ys = [p[1] for p in pts]
-            xmin, ymin, xmax, ymax = min(xs), min(ys), max(xs), max(ys)
-        else:
-            xmin = ymin = xmax = ymax = 0
-        tokens.append({'id': i, 'text': text, 'conf': float(conf), 'bbox': [int(xmin), int(ymin), int(xmax), int(ymax)]})
-    return tokens
+    return _tokens_from_easyocr(reader.readtext(rgb, batch_size=batch_size))
 
 
-def load_ocr_json(path: str) -> List[Dict[str, Any]]:
-    with open(path, encoding='utf-8') as f:
-        data = json.load(f)
-    toks = data.get('tokens', [])
-    # ensure ids and bbox present
-    out = []
-    for i, t in enumerate(toks):
-        tid = t.get('id', i)
-        text = t.get('text', '')
-        conf = float(t.get('conf', 0.0) or 0.0)
-        bbox = t.get('bbox') or [0,0,0,0]
-        out.append({'id': int(tid), 'text': text, 'conf': conf, 'bbox': [int(b) for b in bbox]})
+def run_easyocr_batch(imgs: List[np.ndarray], langs: str = 'en', batch_size: int = 8) -> List[List[Dict[str, Any]]]:
+    """OCR several BGR images; same-sized images share readtext_batched calls."""
+    if not EASYOCR_AVAILABLE:
+        raise RuntimeError('easyocr not available')
+    reader = _get_reader(_langs_key(langs))
+    out: List[List[Dict[str, Any]]] = [[] for _ in imgs]
+    # readtext_batched needs equal sizes, so bucket by shape
+    buckets: Dict[Tuple[int, ...], List[int]] = {}
+    for i, img in enumerate(imgs):
+        buckets.setdefault(img.shape, []).append(i)
+    for idx in buckets.values():
+        rgbs = [cv2.cvtColor(imgs[i], cv2.COLOR_BGR2RGB) for i in idx]
+        if len(rgbs) == 1:
+            results = [reader.readtext(rgbs[0], batch_size=batch_size)]
+        else:
+            results = reader.readtext_batched(rgbs, batch_size=batch_size)
+        for i, res in zip(idx, results):
+            out[i] = _tokens_from_easyocr(res)
     return out
 
 
-def token_centroid(tok: Dict[str, Any]) -> Tuple[float,float]:
-    x1,y1,x2,y2 = tok['bbox']
-    return ((x1+x2)/2.0, (y1+y2)/2.0)
-
-
-def assign_tokens_to_blocks(tokens: List[Dict[str, Any]], blocks: List[Dict[str, Any]], assign_pad: int = 4) -> Dict[int, List[Dict[str,Any]]]:
-    # map block_id -> list of tokens
-    mapping: Dict[int, List[Dict[str, Any]]] = {b['block_id']: [] for b in blocks}
-    # default unassigned bucket -1
-    mapping[-1] = []
-    for t in tokens:
-        cx, cy = token_centroid(t)
-        assigned = False
-        for b in blocks:
-            x1,y1,x2,y2 = b['bbox']
-            if (cx >= x1 - assign_pad) and (cx <= x2 + assign_pad) and (cy >= y1 - assign_pad) and (cy <= y2 + assign_pad):
-                mapping[b['block_id']].append(t)
-                assigned = True
-                break
-        if not assigned:
-            mapping[-1].append(t)
+def _dumps(obj: Any, indent: bool = True) -> bytes:
+    """UTF-8 JSON bytes; orjson when installed, stdlib otherwise."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=(orjson.OPT_INDENT_2 if indent else 0) | orjson.OPT_SERIALIZE_NUMPY)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_ocr_json(path: str) -> TokenArray:
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    toks = data.get('tokens', [])
+    # ensure ids and bbox present; numeric fields go straight into columns
+    bb = np.asarray([t.get('bbox') or (0, 0, 0, 0) for t in toks], dtype=np.float64).reshape(-1, 4)
+    return TokenArray.from_columns(ids=np.asarray([int(t.get('id', i)) for i, t in enumerate(toks)], dtype=np.int64),
+                                   text=[t.get('text', '') for t in toks],
+                                   conf=np.asarray([t.get('conf') or 0.0 for t in toks], dtype=np.float64),
+                                   bb=bb.astype(np.int32))
+
+
+COORD16_MIN, COORD16_MAX = -8192, 16383
+
+
+@dataclass
+class TokenArray:
+    """Tokens stored column-wise: parallel arrays indexed by token position."""
+    ids: np.ndarray
+    text: List[str]
+    conf: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    x2: np.ndarray
+    y2: np.ndarray
+    cx: np.ndarray
+    cy: np.ndarray
+    h: np.ndarray
+
+    @classmethod
+    def from_columns(cls, ids: np.ndarray, text: List[str], conf: np.ndarray, bb: np.ndarray) -> 'TokenArray':
+        bb = np.asarray(bb, dtype=np.int32).reshape(-1, 4)
+        # screen coordinates fit int16; the range leaves headroom so sums and
+        # differences of two coordinates cannot wrap either
+        if not bb.size or (bb.min() >= COORD16_MIN and bb.max() <= COORD16_MAX):
+            bb = bb.astype(np.int16)
+        x1, y1, x2, y2 = (np.ascontiguousarray(bb[:, k]) for k in range(4))
+        return cls(ids=ids, text=[t.strip() for t in text], conf=conf,
+                   x1=x1, y1=y1, x2=x2, y2=y2,
+                   cx=np.add(x1, x2, dtype=np.int32) / 2.0, cy=np.add(y1, y2, dtype=np.int32) / 2.0,
+                   h=np.subtract(y2, y1, dtype=np.int32))
+
+    @classmethod
+    def from_tokens(cls, tokens: List[Dict[str, Any]]) -> 'TokenArray':
+        return cls.from_columns(ids=np.asarray([t['id'] for t in tokens], dtype=np.int64),
+                                text=[t.get('text', '') for t in tokens],
+                                conf=np.asarray([t.get('conf', 0.0) for t in tokens], dtype=np.float64),
+                                bb=[t['bbox'] for t in tokens])
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def __getitem__(self, keep: np.ndarray) -> 'TokenArray':
+        # boolean mask or index array
+        keep = np.asarray(keep)
+        return self.take(np.flatnonzero(keep) if keep.dtype == bool else keep)
+
+    def take(self, idx: np.ndarray) -> 'TokenArray':
+        return TokenArray(ids=self.ids[idx], text=[self.text[i] for i in idx.tolist()], conf=self.conf[idx],
+                          x1=self.x1[idx], y1=self.y1[idx], x2=self.x2[idx], y2=self.y2[idx],
+                          cx=self.cx[idx], cy=self.cy[idx], h=self.h[idx])
+
+
+def _line_from_indices(ta: TokenArray, idx: np.ndarray, line_id: int) -> Dict[str, Any]:
+    """Line dict for tokens idx, ordered left to right."""
+    idx = idx[np.argsort(ta.x1[idx], kind='stable')]
+    xmin = int(min(ta.x1[idx].min(), ta.x2[idx].min()))
+    ymin = int(min(ta.y1[idx].min(), ta.y2[idx].min()))
+    xmax = int(max(ta.x1[idx].max(), ta.x2[idx].max()))
+    ymax = int(max(ta.y1[idx].max(), ta.y2[idx].max()))
+    order = idx.tolist()
+    text = ' '.join([ta.text[i] for i in order]).strip()
+    avg_conf = float(sum(ta.conf[idx].tolist())/max(1, len(order)))
+    return {'line_id': line_id, 'token_ids': ta.ids[idx].tolist(), 'text': text, 'bbox': [xmin, ymin, xmax, ymax], 'avg_conf': avg_conf}
+
+
+ASSIGN_GRID_CELL = 256          # px; uniform grid cell for token->block lookup
+ASSIGN_GRID_MIN_PAIRS = 2_000_000  # T*B above which the grid beats the dense test
+
+
+def _first_containing(cx: np.ndarray, cy: np.ndarray, bb: np.ndarray, pad: int) -> np.ndarray:
+    """Index of the first padded box in bb containing each centroid, -1 if none."""
+    inside = (cx[:, None] >= bb[:, 0] - pad) & (cx[:, None] <= bb[:, 2] + pad) & \
+             (cy[:, None] >= bb[:, 1] - pad) & (cy[:, None] <= bb[:, 3] + pad)
+    return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+
+def _first_containing_grid(cx: np.ndarray, cy: np.ndarray, bb: np.ndarray, pad: int,
+                           cell: int = ASSIGN_GRID_CELL) -> np.ndarray:
+    """Same result as _first_containing, testing only blocks stamped into each centroid's cell."""
+    grid: Dict[Tuple[int,int], List[int]] = {}
+    for j, (x1, y1, x2, y2) in enumerate(bb.tolist()):
+        for gy in range((y1 - pad) // cell, (y2 + pad) // cell + 1):
+            for gx in range((x1 - pad) // cell, (x2 + pad) // cell + 1):
+                grid.setdefault((gx, gy), []).append(j)
+    first = np.full(cx.shape[0], -1, dtype=np.int64)
+    cells = np.stack([np.floor(cx / cell), np.floor(cy / cell)], axis=1).astype(np.int64)
+    uniq, inv = np.unique(cells, axis=0, return_inverse=True)
+    inv = inv.reshape(-1)
+    order = np.argsort(inv, kind='stable')
+    bounds = np.searchsorted(inv[order], np.arange(len(uniq) + 1))
+    for u, (gx, gy) in enumerate(uniq.tolist()):
+        cand = grid.get((gx, gy))
+        if not cand:
+            continue
+        t = order[bounds[u]:bounds[u+1]]
+        cand = np.asarray(cand)  # ascending, so "first" matches the linear scan
+        hit = _first_containing(cx[t], cy[t], bb[cand], pad)
+        first[t] = np.where(hit >= 0, cand[hit], -1)
+    return first
+
+
+def assign_tokens_to_blocks(ta: TokenArray, blocks: List[Dict[str, Any]], assign_pad: int = 4) -> Dict[int, np.ndarray]:
+    """Map block_id -> token indices (ascending); -1 holds unassigned tokens."""
+    if not blocks or not len(ta):
+        mapping = {b['block_id']: np.empty(0, dtype=np.int64) for b in blocks}
+        mapping[-1] = np.arange(len(ta), dtype=np.int64)
+        return mapping
+    bb = np.asarray([b['bbox'] for b in blocks], dtype=np.int64).reshape(-1, 4)
+    # containment of token centroids in padded blocks; first matching block wins.
+    # Dense (T, B) test unless the pair count is large, then grid candidates
+    if len(ta) * len(blocks) < ASSIGN_GRID_MIN_PAIRS:
+        first = _first_containing(ta.cx, ta.cy, bb, assign_pad)
+    else:
+        first = _first_containing_grid(ta.cx, ta.cy, bb, assign_pad)
+    mapping = {b['block_id']: np.flatnonzero(first == j) for j, b in enumerate(blocks)}
+    mapping[-1] = np.flatnonzero(first < 0)
     return mapping
 
 
-def group_tokens_into_lines(tokens: List[Dict[str, Any]], y_overlap_ratio: float = 0.6, y_merge_tol_px: int = 4) -> List[Dict[str,Any]]:
+def _assign_line_groups(y1: np.ndarray, y2: np.ndarray, cy: np.ndarray, hh: np.ndarray,
+                        ratio: float, tol: float) -> Tuple[np.ndarray, int]:
+    """Line index per token, for tokens sorted by top edge.
+
+    A token joins the earliest line having any member it overlaps vertically
+    (inter >= ratio*min_h with centres within tol), else opens a new line.
+    """
+    n = y1.shape[0]
+    gid = np.empty(n, dtype=np.int64)
+    n_groups = 0
+    act = np.empty(0, dtype=np.int64)  # placed tokens that can still match
+    for i in range(n):
+        if ratio > 0 and act.size:
+            # a match needs y2[j] > y1[i]; tops only grow along the sweep, so
+            # tokens ending above this one are closed for good
+            act = act[y2[act] > y1[i]]
+        g = -1
+        if act.size:
+            inter = np.maximum(0, np.minimum(y2[i], y2[act]) - np.maximum(y1[i], y1[act]))
+            min_h = np.maximum(1, np.minimum(hh[i], hh[act]))
+            mask = (inter >= ratio * min_h) & (np.abs(cy[i] - cy[act]) <= tol)
+            if mask.any():
+                g = int(gid[act][mask].min())
+        if g < 0:
+            g = n_groups
+            n_groups += 1
+        gid[i] = g
+        act = np.append(act, i)
+    return gid, n_groups
+
+
+def _line_groups_kernel(y1: np.ndarray, y2: np.ndarray, cy: np.ndarray, hh: np.ndarray,
+                        ratio: float, tol: float) -> np.ndarray:
+    # scalar form of _assign_line_groups for numba; same comparisons in the same types
+    n = y1.shape[0]
+    gid = np.empty(n, dtype=np.int64)
+    act = np.empty(n, dtype=np.int64)
+    na = 0
+    n_groups = 0
+    for i in range(n):
+        if ratio > 0:
+            k = 0
+            for a in range(na):
+                j = act[a]
+                if y2[j] > y1[i]:
+                    act[k] = j
+                    k += 1
+            na = k
+        g = -1
+        for a in range(na):
+            j = act[a]
+            inter = max(0, min(y2[i], y2[j]) - max(y1[i], y1[j]))
+            min_h = max(1, min(hh[i], hh[j]))
+            if inter >= ratio * min_h and abs(cy[i] - cy[j]) <= tol:
+                if g < 0 or gid[j] < g:
+                    g = gid[j]
+        if g < 0:
+            g = n_groups
+            n_groups += 1
+        gid[i] = g
+        act[na] = i
+        na += 1
+    return gid
+
+
+@lru_cache(maxsize=1)
+def _get_line_groups_jit():
+    """Compile _line_groups_kernel on first use (None without numba). One explicit
+    signature; callers widen coordinates to int32 so int16 pages share it."""
+    if not NUMBA_AVAILABLE:
+        return None
+    try:
+        import numba
+        return numba.njit('int64[:](int32[:], int32[:], float64[:], int32[:], float64, float64)',
+                          cache=True)(_line_groups_kernel)
+    except Exception:
+        return None
+
+
+def _line_groups(y1: np.ndarray, y2: np.ndarray, cy: np.ndarray, hh: np.ndarray,
+                 ratio: float, tol: float) -> Tuple[np.ndarray, int]:
+    jit = _get_line_groups_jit()
+    if jit is None:
+        return _assign_line_groups(y1, y2, cy, hh, ratio, tol)
+    gid = jit(y1.astype(np.int32), y2.astype(np.int32), cy.astype(np.float64, copy=False),
+              hh.astype(np.int32, copy=False), ratio, tol)
+    return gid, (int(gid.max()) + 1 if gid.size else 0)
+
+
+def group_tokens_into_lines(ta: TokenArray, idx: np.ndarray, y_overlap_ratio: float = 0.6, y_merge_tol_px: int = 4) -> List[Dict[str,Any]]:
     # simple grouping similar to previous logic
-    if not tokens:
+    if not idx.size:
         return []
-    toks = sorted(tokens, key=lambda t: (t['bbox'][1], (t['bbox'][0]+t['bbox'][2])//2))
-    groups: List[List[Dict[str,Any]]] = []
-    for t in toks:
-        placed = False
-        for g in groups:
-            for gt in g:
-                # check vertical overlap
-                inter = max(0, min(t['bbox'][3], gt['bbox'][3]) - max(t['bbox'][1], gt['bbox'][1]))
-                min_h = max(1, min((t['bbox'][3]-t['bbox'][1]), (gt['bbox'][3]-gt['bbox'][1])))
-                if inter >= y_overlap_ratio * min_h and abs(((t['bbox'][1]+t['bbox'][3])/2.0) - ((gt['bbox'][1]+gt['bbox'][3])/2.0)) <= y_merge_tol_px:
-                    g.append(t)
-                    placed = True
-                    break
-            if placed:
-                break
-        if not placed:
-            groups.append([t])
-    lines = []
-    for lid, g in enumerate(groups):
-        g_sorted = sorted(g, key=lambda x: x['bbox'][0])
-        xs = [tt['bbox'][0] for tt in g_sorted] + [tt['bbox'][2] for tt in g_sorted]
-        ys = [tt['bbox'][1] for tt in g_sorted] + [tt['bbox'][3] for tt in g_sorted]
-        xmin, ymin, xmax, ymax = int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))
-        avg_conf = float(sum(tt.get('conf',0.0) for tt in g_sorted)/max(1,len(g_sorted)))
-        line = {'line_id': lid+1, 'token_ids': [tt['id'] for tt in g_sorted], 'text': ' '.join([tt.get('text','').strip() for tt in g_sorted]).strip(), 'bbox':[xmin,ymin,xmax,ymax], 'avg_conf': avg_conf}
-        lines.append(line)
+    # top edge, then integer x centre; lexsort is stable so ties keep input order
+    idx = idx[np.lexsort((np.add(ta.x1[idx], ta.x2[idx], dtype=np.int32) // 2, ta.y1[idx]))]
+    gid, n_groups = _line_groups(ta.y1[idx], ta.y2[idx], ta.cy[idx], ta.h[idx],
+                                 float(y_overlap_ratio), float(y_merge_tol_px))
+    lines = [_line_from_indices(ta, idx[gid == g], g+1) for g in range(n_groups)]
     # sort lines by reading order
     lines.sort(key=lambda L: (L['bbox'][1], L['bbox'][0]))
     return lines
 
 
-def merge_top_menubar(lines_tokens: List[Dict[str,Any]], menubar_top: int, menubar_height_ratio: float, median_h: float) -> Optional[Dict[str,Any]]:
+def merge_top_menubar(ta: TokenArray, menubar_top: int, menubar_height_ratio: float, median_h: float) -> Optional[Dict[str,Any]]:
     # compute threshold
     thr = menubar_top + menubar_height_ratio * median_h
-    top_tokens = []
-    others = []
-    for t in lines_tokens:
-        # here t are tokens
-        cx, cy = token_centroid(t)
-        if cy <= thr:
-            top_tokens.append(t)
-        else:
-            others.append(t)
-    if not top_tokens:
+    top = np.flatnonzero(ta.cy <= thr)
+    if not top.size:
         return None
-    # create merged line
-    sorted_top = sorted(top_tokens, key=lambda x: x['bbox'][0])
-    xs = [tt['bbox'][0] for tt in sorted_top] + [tt['bbox'][2] for tt in sorted_top]
-    ys = [tt['bbox'][1] for tt in sorted_top] + [tt['bbox'][3] for tt in sorted_top]
-    xmin, ymin, xmax, ymax = int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))
-    text = ' '.join([tt.get('text','').strip() for tt in sorted_top]).strip()
-    avg_conf = float(sum(tt.get('conf',0.0) for tt in sorted_top)/max(1,len(sorted_top)))
-    merged = {'line_id': -1, 'token_ids': [tt['id'] for tt in sorted_top], 'text': text, 'bbox':[xmin,ymin,xmax,ymax], 'avg_conf': avg_conf}
-    return merged
+    return _line_from_indices(ta, top, -1)
 
 
 def draw_preview(img: np.ndarray, blocks: List[Dict[str,Any]], lines: List[Dict[str,Any]], out_path: str) -> None:
-    pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    draw = ImageDraw.Draw(pil)
-    # draw blocks
+    # everything drawn with cv2 on a BGR copy; no PIL conversion
+    canvas = img.copy()
+    font = cv2.FONT_HERSHEY_SIMPLEX
     for b in blocks:
         x1,y1,x2,y2 = b['bbox']
-        draw.rectangle([x1,y1,x2,y2], outline='red', width=2)
-        draw.text((x1, max(0,y1-10)), f"B{b['block_id']}", fill='red')
-    # draw lines
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        cv2.putText(canvas, f"B{b['block_id']}", (x1, max(10, y1-2)), font, 0.4, (0, 0, 255), 1, cv2.LINE_AA)
     for L in lines:
         x1,y1,x2,y2 = L['bbox']
-        draw.rectangle([x1,y1,x2,y2], outline='blue', width=1)
-        draw.text((x1, y1-10), f"L{L.get('line_id')}", fill='blue')
-    pil.save(out_path)
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (255, 0, 0), 1)
+        cv2.putText(canvas, f"L{L.get('line_id')}", (x1, y1-2), font, 0.4, (255, 0, 0), 1, cv2.LINE_AA)
+    if not cv2.imwrite(out_path, canvas):
+        raise OSError(f'could not write {out_path}')
 
 
-def main(argv: Optional[List[str]] = None) -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument('--image', required=True)
-    ap.add_argument('--ocr-json', default=None)
-    ap.add_argument('--run-ocr', action='store_true')
-    ap.add_argument('--ocr-lang', default='en')
-    ap.add_argument('--out', default=None)
-    ap.add_argument('--preview', default=None)
-    ap.add_argument('--menubar-top', type=int, default=0)
-    ap.add_argument('--menubar-height-ratio', type=float, default=1.5)
-    ap.add_argument('--assign-pad', type=int, default=4)
-    ap.add_argument('--cv-baseline', type=int, default=1)
-    ap.add_argument('--min-token-area', type=int, default=12)
-    args = ap.parse_args(argv)
-
-    img, (W,H) = load_image(args.image)
-
-    # get tokens
+def get_tokens(image_path: str, args: argparse.Namespace, ocr_json: Optional[str] = None,
+               ocr_tokens: Optional[List[Dict[str,Any]]] = None) -> TokenArray:
     tokens: List[Dict[str,Any]] = []
-    if args.ocr_json:
-        tokens = load_ocr_json(args.ocr_json)
+    if ocr_json:
+        return load_ocr_json(ocr_json)
+    elif ocr_tokens is not None:
+        tokens = ocr_tokens
     elif args.run_ocr:
         try:
-            tokens = run_easyocr(args.image, langs=args.ocr_lang)
+            tokens = run_easyocr(image_path, langs=args.ocr_lang, batch_size=args.ocr_batch)
         except Exception as e:
             print(f'Warning: OCR failed: {e}', file=sys.stderr)
             tokens = []
     else:
         print('No OCR input provided; use --ocr-json or --run-ocr', file=sys.stderr)
+    return TokenArray.from_tokens(tokens)
 
-    # filter tiny tokens
-    tokens = [t for t in tokens if (t['bbox'][2]-t['bbox'][0])*(t['bbox'][3]-t['bbox'][1]) >= args.min_token_area]
 
-    # detect blocks
+def detect_blocks(img: np.ndarray, args: argparse.Namespace, hf_blocks: Optional[List[Dict[str,Any]]] = None,
+                  try_hf: bool = True) -> Tuple[List[Dict[str,Any]], Optional[str]]:
+    """Detector waterfall HF -> layoutparser -> CV baseline, or just the one picked
+    with --detector. hf_blocks are precomputed HF results (batch mode); try_hf=False
+    skips HF entirely."""
     blocks: List[Dict[str,Any]] = []
     used_method = None
-    if HF_AVAILABLE:
+    detector = args.detector
+    if detector == 'cv':
+        return detect_blocks_cv(img, scale=getattr(args, 'cv_scale', 1.0)), 'cv_baseline'
+    if hf_blocks is not None:
+        blocks = hf_blocks
+        used_method = 'hf'
+    elif try_hf and detector in ('auto', 'hf') and HF_AVAILABLE:
         try:
             blocks = detect_blocks_hf(img)
             used_method = 'hf'
         except Exception as e:
             print(f'HF detection failed: {e}', file=sys.stderr)
+    if detector == 'hf':
+        return blocks, used_method
     if not blocks and LP_AVAILABLE:
         try:
             blocks = detect_blocks_layoutparser(img)
             used_method = 'layoutparser'
         except Exception as e:
             print(f'LayoutParser detection failed: {e}', file=sys.stderr)
+    if detector == 'lp':
+        return blocks, used_method
     if not blocks and args.cv_baseline:
-        blocks = detect_blocks_cv(img)
+        blocks = detect_blocks_cv(img, scale=getattr(args, 'cv_scale', 1.0))
         used_method = 'cv_baseline'
+    return blocks, used_method
 
+
+def build_layout(size: Tuple[int,int], tokens: TokenArray, blocks: List[Dict[str,Any]],
+                 used_method: Optional[str], args: argparse.Namespace) -> Dict[str,Any]:
+    W, H = size
     # assign tokens
     mapping = assign_tokens_to_blocks(tokens, blocks, assign_pad=args.assign_pad)
 
     # compute median token height
-    heights = [max(1, t['bbox'][3]-t['bbox'][1]) for t in tokens]
-    median_h = float(np.median(heights)) if heights else 0.0
+    median_h = float(np.median(np.maximum(1, tokens.h))) if len(tokens) else 0.0
 
     all_lines: List[Dict[str,Any]] = []
     lid = 1
@@ -336,37 +617,124 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     # group per block
     for b in blocks:
-        toks = mapping.get(b['block_id'], [])
-        lines = group_tokens_into_lines(toks)
+        lines = group_tokens_into_lines(tokens, mapping[b['block_id']])
         for L in lines:
             L['line_id'] = lid; lid += 1
             L['block_id'] = b['block_id']
             all_lines.append(L)
 
     # unassigned tokens (-1)
-    unassigned = mapping.get(-1, [])
-    if unassigned:
-        lines = group_tokens_into_lines(unassigned)
+    unassigned = mapping[-1]
+    if unassigned.size:
+        lines = group_tokens_into_lines(tokens, unassigned)
         for L in lines:
             L['line_id'] = lid; lid += 1
             L['block_id'] = None
             all_lines.append(L)
 
-    out = {'image_size': [int(W), int(H)], 'blocks': blocks, 'lines': all_lines, 'method': used_method}
+    return {'image_size': [int(W), int(H)], 'blocks': blocks, 'lines': all_lines, 'method': used_method}
+
 
-    s = json.dumps(out, ensure_ascii=False, indent=2)
-    if args.out:
-        with open(args.out, 'w', encoding='utf-8') as f:
-            f.write(s)
+def emit_layout(out: Dict[str,Any], img: np.ndarray, out_path: Optional[str], preview_path: Optional[str]) -> None:
+    if out_path:
+        with open(out_path, 'wb') as f:
+            f.write(_dumps(out))
     else:
-        print(s)
+        # pretty only for a terminal; piped output stays compact
+        print(_dumps(out, indent=sys.stdout.isatty()).decode('utf-8'))
 
-    if args.preview:
+    if preview_path:
         try:
-            draw_preview(img, blocks, all_lines, args.preview)
+            draw_preview(img, out['blocks'], out['lines'], preview_path)
         except Exception as e:
             print(f'Preview generation failed: {e}', file=sys.stderr)
 
+
+def filter_tiny_tokens(ta: TokenArray, min_area: int) -> TokenArray:
+    # int64 so full-screen boxes cannot overflow the product
+    w = ta.x2.astype(np.int64) - ta.x1
+    h = ta.y2.astype(np.int64) - ta.y1
+    return ta[w * h >= min_area]
+
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def run_image_dir(args: argparse.Namespace) -> int:
+    """Batch mode: HF detection runs once per --batch images; --ocr-json, --out and
+    --preview are directories holding <stem>.json / <stem>.json / <stem>.png."""
+    paths = sorted(os.path.join(args.image_dir, n) for n in os.listdir(args.image_dir) if n.lower().endswith(IMAGE_EXTS))
+    for d in (args.out, args.preview):
+        if d:
+            os.makedirs(d, exist_ok=True)
+    bs = max(1, args.batch)
+    for k in range(0, len(paths), bs):
+        chunk = paths[k:k+bs]
+        loaded = [load_image(p) for p in chunk]
+        hf_results: List[Optional[List[Dict[str,Any]]]] = [None] * len(chunk)
+        if HF_AVAILABLE and args.detector in ('auto', 'hf'):
+            try:
+                hf_results = detect_blocks_hf_batch([img for img, _ in loaded])
+            except Exception as e:
+                print(f'HF detection failed: {e}', file=sys.stderr)
+        ocr_results: List[Optional[List[Dict[str,Any]]]] = [None] * len(chunk)
+        if args.run_ocr and not args.ocr_json:
+            try:
+                ocr_results = run_easyocr_batch([img for img, _ in loaded], langs=args.ocr_lang, batch_size=args.ocr_batch)
+            except Exception as e:
+                print(f'Warning: OCR failed: {e}', file=sys.stderr)
+                ocr_results = [[] for _ in chunk]
+        for path, (img, size), hf_blocks, ocr_tokens in zip(chunk, loaded, hf_results, ocr_results):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            ocr_json = os.path.join(args.ocr_json, stem + '.json') if args.ocr_json else None
+            tokens = filter_tiny_tokens(get_tokens(path, args, ocr_json, ocr_tokens), args.min_token_area)
+            blocks, used_method = detect_blocks(img, args, hf_blocks=hf_blocks or None, try_hf=False)
+            out = build_layout(size, tokens, blocks, used_method, args)
+            emit_layout(out, img,
+                        os.path.join(args.out, stem + '.json') if args.out else None,
+                        os.path.join(args.preview, stem + '.png') if args.preview else None)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--image')
+    src.add_argument('--image-dir', default=None)
+    ap.add_argument('--batch', type=int, default=4)
+    ap.add_argument('--ocr-json', default=None)
+    ap.add_argument('--run-ocr', action='store_true')
+    ap.add_argument('--ocr-lang', default='en')
+    ap.add_argument('--ocr-batch', type=int, default=8)
+    ap.add_argument('--out', default=None)
+    ap.add_argument('--preview', default=None)
+    ap.add_argument('--menubar-top', type=int, default=0)
+    ap.add_argument('--menubar-height-ratio', type=float, default=1.5)
+    ap.add_argument('--assign-pad', type=int, default=4)
+    ap.add_argument('--cv-baseline', type=int, default=1)
+    ap.add_argument('--cv-scale', type=float, default=1.0,
+                    help='run the CV baseline on a downscaled mask (e.g. 0.5); faster, blocks may differ')
+    ap.add_argument('--cpu-threads', type=int, default=None,
+                    help='threads for torch/OpenCV on CPU (default: half the cores for torch)')
+    ap.add_argument('--detector', choices=('auto', 'hf', 'lp', 'cv'), default='auto',
+                    help='auto tries hf -> lp -> cv; the others run only that detector')
+    ap.add_argument('--min-token-area', type=int, default=12)
+    args = ap.parse_args(argv)
+    set_cpu_threads(args.cpu_threads)
+
+    if args.image_dir:
+        return run_image_dir(args)
+
+    img, size = load_image(args.image)
+
+    # get tokens, filter tiny ones
+    tokens = filter_tiny_tokens(get_tokens(args.image, args, args.ocr_json), args.min_token_area)
+
+    # detect blocks
+    blocks, used_method = detect_blocks(img, args)
+
+    out = build_layout(size, tokens, blocks, used_method, args)
+    emit_layout(out, img, args.out, args.preview)
     return 0
 
 
@@ -6,7 +6,7 @@ inspect program tree. The UI is intentionally lightweight so other
 frontends (web_ui etc.) can be plugged in similarly.
 """
 from pathlib import Path
-import threading, sys, time, datetime, os
+import threading, sys, time, datetime, os, io, re
 try:
     # Switch layout before creating QApplication
     from input.keyboard_layout import ensure_english_layout
@@ -25,47 +25,50 @@ import json
 from core.xml_engine import XMLProgram
 import logging
 logger = logging.getLogger('usefulclicker.ui')
+# consoleText keeps at most this many lines
+CONSOLE_MAX_BLOCKS = 2000
+
+# C++-style qualifiers like SomeEnum::Sub::Value -> Value
+_QUAL_RE = re.compile(r"\b[A-Za-z0-9_]+::")
+# empty enum tags, which may produce None during uic processing
+_EMPTY_ENUM_RE = re.compile(r"<enum\s*/>|<enum\s*>\s*</enum>")
+# (path, mtime_ns, size) -> sanitized .ui bytes
+_UI_CACHE = {}
+
+
+def _sanitize_ui(ui_path: Path) -> bytes:
+    st = os.stat(ui_path)
+    key = (str(ui_path), st.st_mtime_ns, st.st_size)
+    data = _UI_CACHE.get(key)
+    if data is None:
+        txt = Path(ui_path).read_text(encoding='utf-8')
+        txt = _QUAL_RE.sub("", txt)
+        txt = _EMPTY_ENUM_RE.sub("<enum>0</enum>", txt)
+        data = _UI_CACHE[key] = txt.encode('utf-8')
+    return data
+
 
 def _load_ui_file(ui_path: Path):
     # Workaround: some .ui files produced by QtDesigner contain C++-style enum
     # qualifiers like "Qt::WindowModality::NonModal" which older/newer PyQt
     # uic.loadUi may fail to resolve. Replace such qualifiers with plain
-    # enum names before loading.
-    txt = Path(ui_path).read_text(encoding='utf-8')
-    # Workarounds for C++-style enum qualifiers that uic may not resolve
-    if 'Qt::WindowModality::' in txt:
-        txt = txt.replace('Qt::WindowModality::', '')
-    if 'QAbstractItemView::SelectionMode::' in txt:
-        txt = txt.replace('QAbstractItemView::SelectionMode::', '')
-    # Generic strip of C++-style qualifiers like SomeEnum::Sub::Value -> Value
-    import re
-    txt = re.sub(r"\b[A-Za-z0-9_]+::", "", txt)
-    # Replace empty enum tags which may produce None during uic processing
-    txt = re.sub(r"<enum\s*/>", "<enum>0</enum>", txt)
-    txt = re.sub(r"<enum\s*>\s*</enum>", "<enum>0</enum>", txt)
-    # Use temporary file to feed uic
-    import tempfile
-    tf = tempfile.NamedTemporaryFile(mode='w', suffix='.ui', delete=False, encoding='utf-8')
+    # enum names before loading. The sanitized text is cached until the file changes.
+    data = _sanitize_ui(ui_path)
     try:
-        tf.write(txt); tf.flush(); tf.close()
-        try:
-            return uic.loadUi(tf.name)
-        except Exception as e:
-            # save problematic ui for inspection
-            try:
-                err_path = tf.name + '.failed'
-                with open(err_path, 'w', encoding='utf-8') as ef:
-                    ef.write(txt[:4000])
-            except Exception:
-                err_path = '<unavailable>'
-            import traceback
-            tb = traceback.format_exc()
-            raise RuntimeError(f'uic.loadUi failed: {e}\nSaved preview: {err_path}\nTrace:\n{tb}')
-    finally:
+        # uic accepts a file-like object; no temp file needed
+        return uic.loadUi(io.BytesIO(data))
+    except Exception as e:
+        # save problematic ui for inspection
         try:
-            import os; os.unlink(tf.name)
+            import tempfile
+            with tempfile.NamedTemporaryFile(mode='wb', suffix='.ui.failed', delete=False) as ef:
+                ef.write(data[:4000])
+                err_path = ef.name
         except Exception:
-            pass
+            err_path = '<unavailable>'
+        import traceback
+        tb = traceback.format_exc()
+        raise RuntimeError(f'uic.loadUi failed: {e}\nSaved preview: {err_path}\nTrace:\n{tb}')
 
 class ProgramThread(threading.Thread):
     def __init__(self, prog: XMLProgram, on_finish=None):
@@ -85,6 +88,92 @@ class ProgramThread(threading.Thread):
             except Exception:
                 pass
 
+def _scan_xml(txt: str):
+    """Parse program XML in a single iterparse pass.
+
+    Returns (tree, foreach_list_name, curiosity_output_var, has_curiosity); tree is
+    None when the text does not parse.
+    """
+    try:
+        from lxml import etree as ET
+    except Exception:
+        import xml.etree.ElementTree as ET
+    foreach_name = None
+    has_cur = False
+    cur_var = None
+    try:
+        it = ET.iterparse(io.BytesIO(txt.encode('utf-8')), events=('start',))
+        root = None
+        for _, n in it:
+            if root is None:
+                # the root itself is not a candidate (matches findall('.//...'))
+                root = n
+                continue
+            tag = n.tag.lower() if isinstance(n.tag, str) else ''
+            if tag == 'foreach':
+                if foreach_name is None and n.get('list'):
+                    foreach_name = n.get('list')
+            elif not has_cur and tag == 'curiositynode':
+                has_cur = True
+            elif not has_cur and tag == 'extnode' and (n.get('module') or '').strip() == 'curiosity_drive_node':
+                # also accept extnode/module=curiosity_drive_node
+                has_cur = True
+                cur_var = n.get('output_var')
+        return it.root, foreach_name, cur_var, has_cur
+    except Exception:
+        return None, None, None, False
+
+if QtWidgets is not None:
+    class ProgSignals(QtCore.QObject):
+        """Engine -> UI notifications. Emitted from the engine thread; Qt queues
+        delivery onto the GUI thread."""
+        stateChanged = QtCore.pyqtSignal()
+        finished = QtCore.pyqtSignal()
+
+        def __init__(self):
+            super().__init__()
+            self._pending = False
+
+        def notify(self):
+            # coalesce bursts of variable writes into a single queued refresh
+            if not self._pending:
+                self._pending = True
+                self.stateChanged.emit()
+
+    class _QtLogHandler(QtCore.QObject, logging.Handler):
+        """logging.Handler that forwards formatted records through a Qt signal so
+        worker threads never touch the console widget directly."""
+        message = QtCore.pyqtSignal(str)
+
+        def __init__(self, level=logging.INFO):
+            QtCore.QObject.__init__(self)
+            logging.Handler.__init__(self, level)
+            self.setFormatter(logging.Formatter("%(message)s"))
+
+        def emit(self, record):
+            try:
+                self.message.emit(self.format(record))
+            except Exception:
+                pass
+
+    class _XmlLoadSignals(QtCore.QObject):
+        loaded = QtCore.pyqtSignal(object)
+
+    class XmlLoadTask(QtCore.QRunnable):
+        """Read and parse a program XML off the GUI thread; result arrives via signals.loaded."""
+        def __init__(self, path: Path, gen: int):
+            super().__init__()
+            self.path = Path(path)
+            self.gen = gen
+            self.signals = _XmlLoadSignals()
+
+        def run(self):
+            try:
+                txt = self.path.read_text(encoding='utf-8')
+            except Exception:
+                txt = ''
+            self.signals.loaded.emit((self.gen, txt) + _scan_xml(txt))
+
 class MainWindowWrapper:
     def __init__(self, xml_path: Path):
         if QtWidgets is None:
@@ -113,6 +202,19 @@ class MainWindowWrapper:
         self._cached_subtopics = {}
         # name of foreach list variable (for current/next display)
         self._foreach_list_name = None
+        # last values pushed to widgets by refresh_state (skip redundant updates)
+        self._last_epoch = None
+        self._last_play_state = None
+        self._last_idx = None
+        self._last_cur_html = None
+        self._cached_disciplines_dirty = False
+        # bumped per load_xml_file so late results from an older load are dropped
+        self._xml_load_gen = 0
+        # curiosity widgets are populated and wired once; the tab waits for the catalyst
+        self._catalyst_inited = False
+        self._curiosity_tab_inited = False
+        self._curiosity_tab_pending = False
+        self._on_disc_slot = None
 
         # Wire basic controls
         self.win.playButton.clicked.connect(self.on_play_pause)
@@ -201,10 +303,24 @@ class MainWindowWrapper:
         except Exception:
             pass
 
-        # timer to refresh state (buttons, labels)
+        # engine state reaches the UI through signals; the timer is only a coarse safety net
+        self._signals = ProgSignals()
+        self._signals.stateChanged.connect(self._on_state_changed)
+        self._signals.finished.connect(self.refresh_state)
+        # console: bounded ring buffer fed by the "usefulclicker" logger from any thread
+        self._log_handler = None
+        try:
+            con = self.win.consoleText
+            if isinstance(con, QtWidgets.QPlainTextEdit):
+                con.setMaximumBlockCount(CONSOLE_MAX_BLOCKS)
+            self._log_handler = _QtLogHandler()
+            self._log_handler.message.connect(self._append_console, QtCore.Qt.QueuedConnection)
+            logging.getLogger('usefulclicker').addHandler(self._log_handler)
+        except Exception:
+            self._log_handler = None
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(self.refresh_state)
-        self.timer.start(200)
+        self.timer.start(2000)
 
         # Editor panel (XMLTab): wire buttons and inputs if present
         # - Add click overlay + live coordinates
@@ -247,12 +363,20 @@ class MainWindowWrapper:
         except Exception:
             pass
 
-    def _log_console(self, msg: str):
+    def _append_console(self, msg: str):
         try:
-            cur = self.win.consoleText.toPlainText()
-            self.win.consoleText.setPlainText(cur + "\n" + str(msg))
+            con = self.win.consoleText
+            if isinstance(con, QtWidgets.QPlainTextEdit):
+                con.appendPlainText(str(msg))
+            else:
+                con.append(str(msg))
         except Exception:
             pass
+
+    def _log_console(self, msg: str):
+        # logger.info reaches the console through _log_handler (queued onto the GUI thread)
+        if getattr(self, '_log_handler', None) is None:
+            self._append_console(msg)
         try:
             logger.info(msg)
         except Exception:
@@ -261,6 +385,7 @@ class MainWindowWrapper:
     def start_program(self):
         # create XMLProgram and start thread
         self.prog = XMLProgram(self.current_xml_path)
+        self.prog.set_state_listener(self._signals.notify)
         # unpause engine to run immediately
         try:
             self.prog.paused = False
@@ -268,10 +393,16 @@ class MainWindowWrapper:
             pass
         self.worker = ProgramThread(self.prog, on_finish=self.on_thread_finish)
         self.worker.start()
+        self.refresh_state()
 
     def on_thread_finish(self):
-        # called in worker thread; schedule UI update in main thread
-        QtCore.QTimer.singleShot(0, self.refresh_state)
+        # called in worker thread; the queued signal runs refresh_state on the GUI thread
+        self._signals.finished.emit()
+
+    def _on_state_changed(self):
+        # clear before reading state so a change made meanwhile queues a new refresh
+        self._signals._pending = False
+        self.refresh_state()
 
     def on_play_pause(self):
         if not self.prog:
@@ -292,24 +423,35 @@ class MainWindowWrapper:
         self.prog.request_restart()
 
     def refresh_state(self):
-        # update play button visual based on program state
         running = self.worker is not None and self.worker.is_alive()
+        # nothing to do while the engine reports no state change since last tick
+        epoch = getattr(self.prog, 'state_epoch', None) if self.prog else None
+        key = (self.prog, epoch, running)
+        if key == self._last_epoch and (self.prog is None or epoch is not None) \
+                and not self._cached_disciplines_dirty:
+            return
+        self._last_epoch = key
+        # update play button visual based on program state
         paused = getattr(self.prog, 'paused', False) if self.prog else False
-        if running and not paused:
-            self.win.playButton.setText('PAUSE')
-            self.win.playButton.setStyleSheet('border: 2px solid #9ece1b')
-        elif running and paused:
-            self.win.playButton.setText('RESUME')
-            self.win.playButton.setStyleSheet('border: 2px solid #e5c07b')
-        else:
-            self.win.playButton.setText('PLAY')
-            self.win.playButton.setStyleSheet('')
+        play_state = (running, paused)
+        if play_state != self._last_play_state:
+            self._last_play_state = play_state
+            if running and not paused:
+                self.win.playButton.setText('PAUSE')
+                self.win.playButton.setStyleSheet('border: 2px solid #9ece1b')
+            elif running and paused:
+                self.win.playButton.setText('RESUME')
+                self.win.playButton.setStyleSheet('border: 2px solid #e5c07b')
+            else:
+                self.win.playButton.setText('PLAY')
+                self.win.playButton.setStyleSheet('')
 
         # update listIndex if engine provides any index info
         idx = None
         if self.prog and isinstance(self.prog.variables.get('index', None), int):
             idx = self.prog.variables.get('index')
-        if idx is not None:
+        if idx is not None and idx != self._last_idx:
+            self._last_idx = idx
             self.win.listIndex.setText(f"{idx}")
 
         # NOTE: do not change visibility of tabs here to avoid flicker/hiding
@@ -357,19 +499,25 @@ class MainWindowWrapper:
                 if isinstance(items, (list, tuple)) and isinstance(idx, int):
                     cur = items[idx] if 0 <= idx < len(items) else ''
                     nxt = items[(idx + 1) % len(items)] if len(items) > 0 else ''
-                    html = (
-                        f'<html><head/><body>'
-                        f'<p><span style=" font-size:10pt; font-weight:700; color:#9ece1b;">Now: {cur}</span></p>'
-                        f'<p><span style=" font-size:10pt; font-weight:700; color:#9ece1b;">Next: {nxt}</span></p>'
-                        f'</body></html>'
-                    )
-                    try:
-                        self.win.currentClickerItemLabel.setText(html)
-                    except Exception:
-                        pass
+                    if (cur, nxt) != self._last_cur_html:
+                        self._last_cur_html = (cur, nxt)
+                        html = (
+                            f'<html><head/><body>'
+                            f'<p><span style=" font-size:10pt; font-weight:700; color:#9ece1b;">Now: {cur}</span></p>'
+                            f'<p><span style=" font-size:10pt; font-weight:700; color:#9ece1b;">Next: {nxt}</span></p>'
+                            f'</body></html>'
+                        )
+                        try:
+                            self.win.currentClickerItemLabel.setText(html)
+                        except Exception:
+                            pass
         except Exception:
             pass
-        # Ensure discipline/subtopics lists stay populated (repair if cleared externally)
+        # Ensure discipline/subtopics lists stay populated (repair if cleared externally);
+        # only the curiosity init paths clear them, and they mark the lists dirty
+        if not self._cached_disciplines_dirty:
+            return
+        self._cached_disciplines_dirty = False
         try:
             dlw = getattr(self.win, 'disciplinesList', None)
             if dlw is not None and dlw.count() == 0 and self._cached_disciplines:
@@ -439,11 +587,18 @@ class MainWindowWrapper:
         self.load_xml_file(Path(fn))
 
     def load_xml_file(self, path: Path):
+        # read + parse run on the global thread pool; _apply_loaded_xml finishes on the GUI thread
         self.current_xml_path = Path(path)
-        try:
-            txt = self.current_xml_path.read_text(encoding='utf-8')
-        except Exception:
-            txt = ''
+        self._xml_load_gen += 1
+        task = XmlLoadTask(self.current_xml_path, self._xml_load_gen)
+        task.signals.loaded.connect(self._apply_loaded_xml)
+        self._xml_task = task
+        QtCore.QThreadPool.globalInstance().start(task)
+
+    def _apply_loaded_xml(self, res):
+        gen, txt, parsed_tree, foreach_name, cur_var, has_cur = res
+        if gen != self._xml_load_gen:
+            return  # a newer load superseded this one
         # update xmlEditor: try setPlainText, fall back to setHtml
         try:
             ed = getattr(self.win, 'xmlEditor', None)
@@ -457,69 +612,22 @@ class MainWindowWrapper:
                         pass
         except Exception:
             pass
-        # parse and populate tree widget
-        try:
-            from lxml import etree as ET
-        except Exception:
-            import xml.etree.ElementTree as ET
-        try:
-            self.parsed_tree = ET.fromstring(txt.encode('utf-8'))
-        except Exception:
-            self.parsed_tree = None
-        self.populate_tree()
-        # detect foreach list for clicker program (for current/next display)
-        try:
-            self._foreach_list_name = None
-            if self.parsed_tree is not None:
-                for n in self.parsed_tree.findall('.//foreach'):
-                    ln = n.get('list')
-                    if ln:
-                        self._foreach_list_name = ln
-                        break
-        except Exception:
-            self._foreach_list_name = None
+        self.parsed_tree = parsed_tree
+        self._foreach_list_name = foreach_name
+        # let pending input events drain before the tree rebuild
+        QtCore.QTimer.singleShot(0, self.populate_tree)
         # initialize CuriosityNode controls if present in XML
         try:
-            has_cur = False
-            if self.parsed_tree is not None:
-                for n in self.parsed_tree.findall('.//*'):
-                    try:
-                        tag = (n.tag or '').lower()
-                        if tag == 'curiositynode':
-                            has_cur = True; break
-                        # also accept extnode/module=curiosity_drive_node
-                        if tag == 'extnode' and ( (n.get('module') or '').strip() == 'curiosity_drive_node' ):
-                            has_cur = True
-                            try:
-                                ov = n.get('output_var')
-                                if ov:
-                                    self._curiosity_output_var = ov
-                            except Exception:
-                                pass
-                            break
-                    except Exception:
-                        continue
-            if has_cur:
-                self._init_curiosity_tab()
-            # detect llmcall presence as well and set tab visibility
-            has_llm = False
-            try:
-                if self.parsed_tree is not None:
-                    for n in self.parsed_tree.findall('.//*'):
-                        try:
-                            if (n.tag or '').lower() == 'llmcall':
-                                has_llm = True; break
-                        except Exception:
-                            continue
-            except Exception:
-                has_llm = False
+            if cur_var:
+                self._curiosity_output_var = cur_var
+            if has_cur and not self._curiosity_tab_inited:
+                # the catalyst shares disciplinesList; populate after it so this list wins
+                if self._catalyst_inited:
+                    self._init_curiosity_tab()
+                else:
+                    self._curiosity_tab_pending = True
             # Do not toggle tab visibility here; showing/hiding tabs from
             # XML caused overlapping-tab redraw glitches. Keep tabs static.
-            # schedule re-init after a short delay in case other UI actions clear widgets
-            try:
-                QtCore.QTimer.singleShot(700, lambda: self._init_curiosity_tab() if has_cur else None)
-            except Exception:
-                pass
         except Exception:
             pass
 
@@ -938,7 +1046,12 @@ class MainWindowWrapper:
         return None
 
     def _init_curiosity_tab(self):
-        """Populate disciplinesList and subtopicsList from curiosity_drive_node module."""
+        """Populate disciplinesList and subtopicsList from curiosity_drive_node module (once)."""
+        if self._curiosity_tab_inited:
+            return
+        self._curiosity_tab_inited = True
+        self._curiosity_tab_pending = False
+        self._cached_disciplines_dirty = True
         # ensure repo root is on sys.path so curiosity_drive_node can be imported
         try:
             repo_root = Path(__file__).resolve().parents[2]
@@ -1004,6 +1117,7 @@ class MainWindowWrapper:
                         except Exception:
                             txt = None
                     slw.clear()
+                    self._cached_disciplines_dirty = True
                     if txt and getattr(cdn, 'subtopics', None):
                         items = cdn.subtopics.get(txt, [])
                         for it in items:
@@ -1012,6 +1126,12 @@ class MainWindowWrapper:
                             except Exception:
                                 slw.addItem(repr(it))
                 try:
+                    if self._on_disc_slot is not None:
+                        try:
+                            dlw.currentItemChanged.disconnect(self._on_disc_slot)
+                        except TypeError:
+                            pass
+                    self._on_disc_slot = _on_discipline_changed
                     dlw.currentItemChanged.connect(_on_discipline_changed)
                 except Exception:
                     try:
@@ -1022,6 +1142,18 @@ class MainWindowWrapper:
             pass
 
     def _init_curiosity_catalyst(self):
+        if self._catalyst_inited:
+            return
+        self._catalyst_inited = True
+        try:
+            self._setup_curiosity_catalyst()
+        finally:
+            if self._curiosity_tab_pending:
+                self._init_curiosity_tab()
+
+    def _setup_curiosity_catalyst(self):
+        # may clear the shared disciplines list; let refresh_state re-check it
+        self._cached_disciplines_dirty = True
         # find widgets
         try:
             tab = getattr(self.win, 'CuriosityCatalystTab', None)
@@ -1122,6 +1254,16 @@ class MainWindowWrapper:
         except Exception:
             pass
 
+    @staticmethod
+    def _tag_text(node, default='<tag>'):
+        try:
+            return str(node.tag)
+        except Exception:
+            try:
+                return repr(node.tag)
+            except Exception:
+                return default
+
     def populate_tree(self):
         # If no treeWidget in UI (widget removed), skip populating tree
         tw = getattr(self.win, 'treeWidget', None)
@@ -1130,35 +1272,26 @@ class MainWindowWrapper:
         tw.clear()
         if not getattr(self, 'parsed_tree', None):
             return
-        def add_item(parent, node):
-            if hasattr(node, 'tag'):
-                try:
-                    text = str(node.tag)
-                except Exception:
-                    try:
-                        text = repr(node.tag)
-                    except Exception:
-                        text = '<tag>'
-            else:
-                text = str(node)
-            it = QtWidgets.QTreeWidgetItem([text])
-            parent.addChild(it)
-            for ch in list(node):
-                add_item(it, ch)
-
         root = self.parsed_tree
-        try:
-            root_text = str(root.tag)
-        except Exception:
-            try:
-                root_text = repr(root.tag)
-            except Exception:
-                root_text = '<root>'
-        root_item = QtWidgets.QTreeWidgetItem([root_text])
-        tw.addTopLevelItem(root_item)
-        for ch in list(root):
-            add_item(root_item, ch)
-        tw.expandAll()
+        root_item = QtWidgets.QTreeWidgetItem([self._tag_text(root, '<root>')])
+        # build the whole item tree detached (children added per parent in one
+        # addChildren call), then attach it to the widget once
+        stack = [(root_item, list(root))]
+        while stack:
+            parent, kids = stack.pop()
+            items = [QtWidgets.QTreeWidgetItem([self._tag_text(c)]) for c in kids]
+            parent.addChildren(items)
+            for it, c in zip(items, kids):
+                if len(c):
+                    stack.append((it, list(c)))
+        tw.setUpdatesEnabled(False)
+        tw.blockSignals(True)
+        try:
+            tw.addTopLevelItem(root_item)
+            tw.expandAll()
+        finally:
+            tw.blockSignals(False)
+            tw.setUpdatesEnabled(True)
 
     def on_perceive(self):
         """Show perception window and dump detected rects+texts to PerceiveNode tab console."""
@@ -1316,14 +1449,12 @@ class MainWindowWrapper:
             client = OllamaClient()
             llm_out = client.generate_text(prompt, model='llama3.2:latest')
             try:
-                cur = self.win.consoleText.toPlainText()
-                self.win.consoleText.setPlainText(cur + '\n\n==== LLM PROMPT ====\n' + prompt + '\n\n==== LLM OUTPUT (ollama) ====\n' + llm_out)
+                self._append_console('\n==== LLM PROMPT ====\n' + prompt + '\n\n==== LLM OUTPUT (ollama) ====\n' + llm_out)
             except Exception:
                 pass
         except Exception as e:
             try:
-                cur = self.win.consoleText.toPlainText()
-                self.win.consoleText.setPlainText(cur + f'\n\nLLM call failed: {e}')
+                self._append_console(f'\nLLM call failed: {e}')
             except Exception:
                 pass
         return